@@ -1,9 +1,38 @@
 import os
+
+# Green-thread serving (AGL_ASYNC_MODE=eventlet or gevent) has to patch the
+# standard library before anything else imports socket, threading or select.
+# Patched, the pure-Python MySQL driver, the connection pool and every
+# background task yield instead of blocking, and sockets cost a green
+# thread rather than an OS thread.
+ASYNC_MODE = os.environ.get('AGL_ASYNC_MODE') or None
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
 from . import db
+from . import agent_pool
+from . import agent_store
+from . import db_pool
+from . import game_archive
+from . import game_clock
+from . import game_state
+from . import leaderboard
+from . import matchmaking
+from . import move_journal
+from . import match_runner
+from . import metrics
+from . import ratings
+from . import replay
+from . import spectator
+from . import tournament_cache
 from flask import Flask
 from flask_socketio import SocketIO
 
-socketio = SocketIO(cors_allowed_origins="*")
+socketio = SocketIO(cors_allowed_origins="*", async_mode=ASYNC_MODE)
 
 def create_app(test_config=None):
     app = Flask(__name__, instance_relative_config=True)
@@ -22,23 +51,94 @@ def create_app(test_config=None):
     except OSError:
         pass
 
-    # Initialize Socket.IO with app
-    socketio.init_app(app)
+    # Shared MySQL connection pool (DB_POOL_SIZE, DB_POOL_TIMEOUT, ...)
+    db_pool.init_app(app)
+
+    # Versioned schema migrations (`flask migrate`, DB_AUTO_MIGRATE)
+    db.init_app(app)
+
+    # SGF downloads and `flask export-archive` for finished games
+    game_archive.init_app(app)
+
+    # Where live games are kept (GAME_STATE_BACKEND = 'memory' or 'sqlite')
+    game_state.init_app(app)
+
+    # Initialize Socket.IO with app; with SOCKETIO_MESSAGE_QUEUE set (e.g.
+    # redis://localhost:6379/0) emits fan out to every server process
+    socketio.init_app(app, message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'))
 
     from .auth import bp1 as auth_bp1
     from .auth import bp2 as auth_bp2
     from .game_controller import bp_game
     from .tournament import bp_tournament
+    from .leaderboard import bp_leaderboard
+    from .game_archive import bp_archive
+    from .metrics import bp_metrics
     from .game_events import initialize_socketio
 
     app.register_blueprint(auth_bp1)
     app.register_blueprint(auth_bp2)
     app.register_blueprint(bp_game)
     app.register_blueprint(bp_tournament)
+    app.register_blueprint(bp_leaderboard)
+    app.register_blueprint(bp_archive)
+    app.register_blueprint(bp_metrics)
+
+    # Latency histograms and emit counters served at /metrics; has to wrap
+    # socketio before initialize_socketio registers the handlers
+    metrics.init_app(app, socketio)
     
     initialize_socketio(socketio)  # Pass socketio instance to initialize
+
+    # Server-authoritative game clocks and their shared timer wheel
+    game_clock.init_app(app, socketio)
+
+    # Elo-indexed matchmaking queue and its window-widening sweep
+    matchmaking.init_app(app, socketio)
+
+    # Warm agent subprocesses shared by every game (AGENT_POOL_MAX_PROCESSES, ...)
+    agent_pool.init_app(app)
+
+    # Content-addressed agent uploads, validated and warmed up before play
+    agent_store.init_app(app, socketio)
+
+    # Server-side runner that plays live games out without browser polling
+    match_runner.init_app(app, socketio)
+
+    # Coalesced, rate-capped frames for spectators and tournament tickers
+    spectator.init_app(app, socketio)
+
+    # Order-statistic leaderboard over users.elo, rebuilt from MySQL at startup
+    leaderboard.init_app(app)
+
+    # Batched Elo updates for finished games (RATING_BATCH_SIZE, ...)
+    ratings.init_app(app, socketio)
+
+    # Read-through cache for tournament pages (TOURNAMENT_CACHE_TTL, PARTICIPANT_PAGE_SIZE)
+    tournament_cache.init_app(app)
+
+    # Snapshot-plus-delta replays for seeking and paged move history
+    replay.init_app(app)
+
+    # Durable move journals: replay unfinished games, then group-commit new moves
+    move_journal.init_app(app, socketio)
     
     # Store for access via current_app.socketio
     app.socketio = socketio  
 
     return app
+
+def serve(app, host='0.0.0.0', port=5000):
+    """Run the Socket.IO server in the configured async mode"""
+    kwargs = {}
+    if ASYNC_MODE == 'eventlet':
+        # eventlet.wsgi caps concurrent connections at 1024 by default
+        kwargs['max_size'] = app.config.get('SOCKETIO_MAX_CONNECTIONS', 20000)
+    if ASYNC_MODE:
+        try:
+            import resource
+            soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ImportError, ValueError, OSError):
+            pass
+    socketio.run(app, host=host, port=port, **kwargs)
@@ -0,0 +1,11 @@
+"""Serve the app: `AGL_ASYNC_MODE=eventlet python -m <package> [--host H] [--port P]`"""
+import argparse
+
+from . import create_app, serve
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--host', default='0.0.0.0')
+parser.add_argument('--port', type=int, default=5000)
+args = parser.parse_args()
+
+serve(create_app(), host=args.host, port=args.port)
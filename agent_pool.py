@@ -0,0 +1,245 @@
+import json
+import os
+import select
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from .agent_store import agent_store
+from .go_rules import GoEngine
+from .metrics import AGENT_MOVE_SECONDS
+from .observation import ObservationBuffer
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'agent_worker.py')
+
+
+class AgentError(Exception):
+    """The agent failed to start, crashed, or returned an error for a move"""
+
+
+class MoveTimeout(AgentError):
+    """The agent did not answer within the per-move wall-clock budget"""
+
+
+def agent_path(username, agent_file, agent_hash=None):
+    """Where a user's agent lives: the agent store, or the per-user folder
+    register() used before the store existed"""
+    if agent_hash:
+        return agent_store.path(agent_hash)
+    return os.path.join(username, agent_file)
+
+
+class AgentWorker:
+    """One warm subprocess hosting an imported agent"""
+
+    def __init__(self, path, entrypoint, memory_mb, start_timeout):
+        self.path = path
+        self.started = time.perf_counter()
+        self.moves = 0
+        self.observation = None
+        self.proc = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT, path, entrypoint, str(memory_mb)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1,
+        )
+        reply = self._read(start_timeout)
+        if not reply.get('ready'):
+            self.kill()
+            raise AgentError(reply.get('error', 'agent failed to start'))
+        # Checked once when the worker loads the agent
+        self.takes_planes = bool(reply.get('planes'))
+
+    @property
+    def alive(self):
+        return self.proc.poll() is None
+
+    def _read(self, timeout):
+        ready, _, _ = select.select([self.proc.stdout], [], [], timeout)
+        if not ready:
+            self.kill()
+            raise MoveTimeout(f"{self.path} did not answer within {timeout}s")
+        line = self.proc.stdout.readline()
+        if not line:
+            self.kill()
+            raise AgentError(f"{self.path} exited with code {self.proc.wait()}")
+        return json.loads(line)
+
+    def _observe(self, board, player):
+        """Planes for a nested-list board, in a segment this worker reuses"""
+        engine = GoEngine(len(board), board=board)
+        if self.observation is None or self.observation.size != engine.size:
+            if self.observation is not None:
+                self.observation.close()
+            self.observation = ObservationBuffer(engine.size)
+        self.observation.reset(engine, player)
+        return self.observation
+
+    def request_move(self, board, player, timeout):
+        if not isinstance(board, ObservationBuffer) and self.takes_planes:
+            # Three-argument agents get planes even when the caller has a board
+            board = self._observe(board, player)
+        if isinstance(board, ObservationBuffer):
+            # The worker reads the planes straight out of shared memory
+            request = {'observation': board.name, 'player': player}
+        else:
+            request = {'board': board, 'player': player}
+        try:
+            self.proc.stdin.write(json.dumps(request) + '\n')
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.kill()
+            raise AgentError(f"{self.path} is not running")
+        reply = self._read(timeout)
+        if 'error' in reply:
+            raise AgentError(reply['error'])
+        self.moves += 1
+        return tuple(reply['move']) if reply['move'] is not None else None
+
+    def kill(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+        if self.observation is not None:
+            self.observation.close()
+            self.observation = None
+
+
+class AgentStats:
+    __slots__ = ('cold_starts', 'cold_start_seconds', 'warm_moves', 'warm_move_seconds',
+                 'timeouts', 'crashes', 'evictions')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def to_dict(self):
+        return {
+            'cold_starts': self.cold_starts,
+            'cold_start_ms': 1000 * self.cold_start_seconds / self.cold_starts if self.cold_starts else None,
+            'warm_moves': self.warm_moves,
+            'warm_move_ms': 1000 * self.warm_move_seconds / self.warm_moves if self.warm_moves else None,
+            'timeouts': self.timeouts,
+            'crashes': self.crashes,
+            'evictions': self.evictions,
+        }
+
+
+class AgentPool:
+    """Warm agent subprocesses keyed by agent file, reused across games.
+
+    At most max_processes workers exist at once; when a new one is needed the
+    least recently used idle worker is stopped. A worker that times out,
+    crashes or exceeds its memory budget is killed and replaced on the next
+    request for that agent.
+    """
+
+    def __init__(self, max_processes=32, move_timeout=5.0, start_timeout=30.0,
+                 memory_mb=512, entrypoint='get_move'):
+        self.max_processes = max_processes
+        self.move_timeout = move_timeout
+        self.start_timeout = start_timeout
+        self.memory_mb = memory_mb
+        self.entrypoint = entrypoint
+        self._idle = OrderedDict()   # (path, worker id) -> worker, oldest first
+        self._busy = 0
+        self._stats = {}
+        self._cond = threading.Condition()
+
+    def init_app(self, app):
+        self.max_processes = app.config.setdefault('AGENT_POOL_MAX_PROCESSES', 32)
+        self.move_timeout = app.config.setdefault('AGENT_MOVE_TIMEOUT', 5.0)
+        self.start_timeout = app.config.setdefault('AGENT_START_TIMEOUT', 30.0)
+        self.memory_mb = app.config.setdefault('AGENT_MEMORY_MB', 512)
+        self.entrypoint = app.config.setdefault('AGENT_ENTRYPOINT', 'get_move')
+
+    def _stats_for(self, path):
+        return self._stats.setdefault(path, AgentStats())
+
+    def _count(self, path, **deltas):
+        """Bump path's counters under the pool lock"""
+        with self._cond:
+            stats = self._stats_for(path)
+            for name, delta in deltas.items():
+                setattr(stats, name, getattr(stats, name) + delta)
+
+    def _checkout(self, path):
+        """An idle warm worker for path, or None once a process slot is reserved"""
+        with self._cond:
+            while True:
+                for key in reversed(self._idle):
+                    if key[0] == path:
+                        worker = self._idle.pop(key)
+                        if worker.alive:
+                            self._busy += 1
+                            return worker
+                        worker.kill()
+                        self._stats_for(path).crashes += 1
+                        break
+                else:
+                    if len(self._idle) + self._busy < self.max_processes:
+                        self._busy += 1
+                        return None
+                    if self._idle:
+                        _, victim = self._idle.popitem(last=False)
+                        victim.kill()
+                        self._stats_for(victim.path).evictions += 1
+                        self._busy += 1
+                        return None
+                    self._cond.wait()
+
+    def _checkin(self, worker):
+        with self._cond:
+            self._busy -= 1
+            if worker is not None and worker.alive:
+                self._idle[(worker.path, id(worker))] = worker
+            self._cond.notify()
+
+    def request_move(self, path, board, player):
+        """Ask the agent at path for a move; board is nested lists or an
+        ObservationBuffer shared with the worker"""
+        worker = self._checkout(path)
+        started = time.perf_counter()
+        try:
+            if worker is None:
+                worker = AgentWorker(path, self.entrypoint, self.memory_mb, self.start_timeout)
+                move = worker.request_move(board, player, self.move_timeout)
+                elapsed = time.perf_counter() - started
+                self._count(path, cold_starts=1, cold_start_seconds=elapsed)
+                AGENT_MOVE_SECONDS.observe(elapsed, start='cold')
+            else:
+                move = worker.request_move(board, player, self.move_timeout)
+                elapsed = time.perf_counter() - started
+                self._count(path, warm_moves=1, warm_move_seconds=elapsed)
+                AGENT_MOVE_SECONDS.observe(elapsed, start='warm')
+            return move
+        except MoveTimeout:
+            self._count(path, timeouts=1)
+            raise
+        except AgentError:
+            if worker is None or not worker.alive:
+                self._count(path, crashes=1)
+            raise
+        finally:
+            self._checkin(worker)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'processes': len(self._idle) + self._busy,
+                'busy': self._busy,
+                'agents': {path: s.to_dict() for path, s in self._stats.items()},
+            }
+
+    def shutdown(self):
+        with self._cond:
+            while self._idle:
+                _, worker = self._idle.popitem()
+                worker.kill()
+
+
+agent_pool = AgentPool()
+
+
+def init_app(app):
+    agent_pool.init_app(app)
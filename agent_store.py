@@ -0,0 +1,175 @@
+import ast
+import hashlib
+import importlib.util
+import os
+import py_compile
+import queue
+import sys
+import tempfile
+
+from .db_pool import get_db
+from .metrics import log_error
+from .packed_board import BOARD_SIZE
+
+CHUNK_SIZE = 64 * 1024
+
+PENDING, READY, FAILED = 'pending', 'ready', 'failed'
+
+
+class AgentTooLarge(ValueError):
+    """The upload went over AGENT_MAX_BYTES"""
+
+
+class AgentStore:
+    """Uploaded agents stored once per SHA-256 of their contents.
+
+    Files live at <root>/<first two hex digits>/<digest>.py, so identical
+    uploads share one file and one prepared bytecode cache.
+    """
+
+    def __init__(self, root=None, max_bytes=1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest + '.py')
+
+    def save(self, stream):
+        """Stream an upload to disk, hashing as it goes; returns the digest"""
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise AgentTooLarge(f"Agent file is larger than {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    out.write(chunk)
+            digest = digest.hexdigest()
+            path = self.path(digest)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return digest
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+agent_store = AgentStore()
+
+_prepare_queue = queue.Queue()
+
+
+def missing_modules(path):
+    """Top-level modules the agent imports that this interpreter can't find"""
+    with open(path, 'rb') as f:
+        tree = ast.parse(f.read(), path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+            names.add(node.module.split('.')[0])
+    return sorted(name for name in names
+                  if name not in sys.builtin_module_names and importlib.util.find_spec(name) is None)
+
+
+def prepare(digest):
+    """Validate, precompile and warm up one agent; raises on failure"""
+    # Import here to avoid circular imports
+    from .agent_pool import agent_pool
+
+    path = agent_store.path(digest)
+    # Writes __pycache__ next to the file, which every worker import reuses
+    py_compile.compile(path, doraise=True)
+    missing = missing_modules(path)
+    if missing:
+        raise ImportError(f"Missing dependencies: {', '.join(missing)}")
+    # First move on an empty board; leaves a warm worker in the pool
+    agent_pool.request_move(path, [[0] * BOARD_SIZE for _ in range(BOARD_SIZE)], 1)
+
+
+def _set_status(app, digest, status, error=None):
+    with app.app_context():
+        db = get_db()
+        cursor = db.cursor()
+        try:
+            cursor.execute("UPDATE agents SET status = %s, error = %s WHERE hash = %s",
+                           (status, error, digest))
+            db.commit()
+        finally:
+            cursor.close()
+            db.close()
+
+
+def _prepare_loop(app, socketio):
+    while True:
+        try:
+            digest = _prepare_queue.get_nowait()
+        except queue.Empty:
+            socketio.sleep(0.5)
+            continue
+        try:
+            prepare(digest)
+            status, error = READY, None
+        except Exception as e:
+            status, error = FAILED, str(e)[:1000]
+        try:
+            _set_status(app, digest, status, error)
+        except Exception as e:
+            log_error("agent_status_write_failed", e, agent=digest[:12], status=status)
+
+
+def register_agent(cursor, stream):
+    """Store an upload and record it; returns (digest, is_new).
+
+    Pass new digests to queue_prepare once the transaction commits. An
+    upload identical to one already stored reuses its prepared state.
+    """
+    digest = agent_store.save(stream)
+    cursor.execute("INSERT IGNORE INTO agents (hash, status) VALUES (%s, %s)", (digest, PENDING))
+    return digest, cursor.rowcount == 1
+
+
+def queue_prepare(digest):
+    _prepare_queue.put(digest)
+
+
+def _requeue_pending(app):
+    with app.app_context():
+        db = get_db()
+        cursor = db.cursor()
+        try:
+            cursor.execute("SELECT hash FROM agents WHERE status = %s", (PENDING,))
+            for (digest,) in cursor.fetchall():
+                queue_prepare(digest)
+        finally:
+            cursor.close()
+            db.close()
+
+
+def init_app(app, socketio):
+    """Configure the store (AGENT_STORE_DIR, AGENT_MAX_BYTES) and start preparing agents"""
+    agent_store.root = app.config.setdefault(
+        'AGENT_STORE_DIR', os.path.join(app.instance_path, 'agents'))
+    agent_store.max_bytes = app.config.setdefault('AGENT_MAX_BYTES', 1024 * 1024)
+    # Werkzeug buffers the whole request before the upload is read, so cap
+    # the request itself; the slack covers the form fields and multipart framing.
+    # Flask defines the key as None, so setdefault would never apply
+    if app.config.get('MAX_CONTENT_LENGTH') is None:
+        app.config['MAX_CONTENT_LENGTH'] = agent_store.max_bytes + 64 * 1024
+    try:
+        _requeue_pending(app)
+    except Exception as e:
+        log_error("agent_requeue_failed", e)
+    socketio.start_background_task(_prepare_loop, app, socketio)
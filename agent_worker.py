@@ -0,0 +1,129 @@
+"""Subprocess that hosts one uploaded agent for the agent pool.
+
+Run as `python agent_worker.py <agent file> <entrypoint> <memory limit MB>`.
+The agent is imported once, then each stdin line is a JSON move request
+({"board": [[...]], "player": 1}) answered with one stdout line
+({"move": [x, y]} or {"move": null} to pass, {"error": "..."} on failure).
+
+A request may instead name a shared-memory observation segment
+({"observation": "<name>", "player": 1}); see observation.py for the
+layout. The segment is mapped once and read in place. Agents whose
+entrypoint takes a third argument receive the read-only feature planes
+as a NumPy array, shaped (planes, size, size). Two-argument agents still
+get the board as nested lists, built in this process.
+
+The ready line reports {"planes": true} for three-argument agents, and the
+pool then sends them observations only, building one from any nested board.
+"""
+import importlib.util
+import inspect
+import json
+import os
+import sys
+import traceback
+
+
+def limit_memory(megabytes):
+    if megabytes <= 0:
+        return
+    try:
+        import resource
+        limit = megabytes * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def load_agent(path, entrypoint):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    spec = importlib.util.spec_from_file_location("agent", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, entrypoint)
+
+
+# Header slots shared with observation.py
+HEADER_FIELDS, H_MAGIC, H_SIZE, H_PLANES = 8, 0, 1, 2
+MAGIC = 0x47504C4E
+MAX_SEGMENTS = 8
+
+_segments = {}
+
+
+def attach(name):
+    """Read-only (board, planes) views of an observation segment, mapped once"""
+    if name in _segments:
+        return _segments[name][1:]
+    import numpy as np
+    from multiprocessing import resource_tracker, shared_memory
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before 3.13 attaching registers the segment with this process's
+        # resource tracker, which would unlink it when the worker exits
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+    header = np.ndarray((HEADER_FIELDS,), dtype=np.int32, buffer=shm.buf)
+    if header[H_MAGIC] != MAGIC:
+        shm.close()
+        raise ValueError(f"{name} is not an observation segment")
+    size, nplanes = int(header[H_SIZE]), int(header[H_PLANES])
+    planes = np.ndarray((nplanes, size, size), dtype=np.uint8,
+                        buffer=shm.buf, offset=HEADER_FIELDS * 4)
+    planes.flags.writeable = False
+    if len(_segments) >= MAX_SEGMENTS:
+        # Games end; drop the oldest mapping (dicts keep insertion order)
+        _segments.pop(next(iter(_segments)))
+    _segments[name] = (shm, planes[0], planes)
+    return planes[0], planes
+
+
+def takes_planes(get_move):
+    try:
+        parameters = inspect.signature(get_move).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    positional = [p for p in parameters if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)]
+    return len(positional) >= 3 or any(p.kind == p.VAR_POSITIONAL for p in parameters)
+
+
+def reply(out, payload):
+    out.write(json.dumps(payload) + "\n")
+    out.flush()
+
+
+def main():
+    agent_path, entrypoint, memory_mb = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    # Keep the protocol stream private; agent prints go to stderr
+    out = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    sys.stdout = sys.stderr
+    limit_memory(memory_mb)
+    try:
+        get_move = load_agent(agent_path, entrypoint)
+    except Exception:
+        reply(out, {"error": traceback.format_exc(limit=3)})
+        return
+    wants_planes = takes_planes(get_move)
+    reply(out, {"ready": True, "planes": wants_planes})
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            if "observation" in request:
+                board, planes = attach(request["observation"])
+                if wants_planes:
+                    move = get_move(board, request["player"], planes)
+                else:
+                    move = get_move(board.tolist(), request["player"])
+            else:
+                move = get_move(request["board"], request["player"])
+            reply(out, {"move": [int(v) for v in move] if move is not None else None})
+        except MemoryError:
+            reply(out, {"error": "memory budget exceeded"})
+            return
+        except Exception:
+            reply(out, {"error": traceback.format_exc(limit=3)})
+
+
+if __name__ == "__main__":
+    main()
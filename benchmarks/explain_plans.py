@@ -0,0 +1,75 @@
+"""EXPLAIN the hot queries from routes.py and the tournament modules and flag scans.
+
+A query fails the check when MySQL plans a full table scan (type ALL) on a
+table with no usable index for it. A scan the optimizer picked despite an
+available index (common on tiny tables) is only reported as a warning.
+
+    python -m <package>.benchmarks.explain_plans --user root --database register
+"""
+import argparse
+import sys
+
+import mysql.connector
+
+from ..auth.routes import MATCH_PLAYER_QUERY, OPEN_MATCH_QUERY, USER_BY_NAME_QUERY
+from ..tournament import REGISTRATION_QUERY, SEEDING_QUERY
+from ..tournament_cache import PARTICIPANTS_PAGE_QUERY, TOURNAMENT_LIST_QUERY, TOURNAMENT_QUERY
+from ..tournament_executor import BRACKET_QUERY
+
+# (where it runs, query, sample parameters); the queries are the code's own
+QUERIES = [
+    ("routes.register / login", USER_BY_NAME_QUERY, ("alice",)),
+    ("routes.find_match user", MATCH_PLAYER_QUERY, (1,)),
+    ("routes.find_match existing match", OPEN_MATCH_QUERY, (1, 1)),
+    ("tournament_cache.tournament_list", TOURNAMENT_LIST_QUERY, ()),
+    ("tournament_cache.tournament_summary", TOURNAMENT_QUERY, (1,)),
+    ("tournament_cache.participants_page", PARTICIPANTS_PAGE_QUERY, (1, 0, 101)),
+    ("tournament.register_for_tournament", REGISTRATION_QUERY, (1, 1)),
+    ("tournament.start_tournament seeding", SEEDING_QUERY, (1,)),
+    ("tournament_executor bracket", BRACKET_QUERY, (1,)),
+]
+
+
+def check(cursor):
+    failures = warnings = 0
+    for name, query, params in QUERIES:
+        cursor.execute("EXPLAIN " + query, params)
+        for row in cursor.fetchall():
+            if row['type'] != 'ALL':
+                continue
+            if row['possible_keys'] is None:
+                # The whole tournament list is read by design
+                if name == "tournament_cache.tournament_list" and row['table'] == 't':
+                    continue
+                failures += 1
+                level = "FAIL"
+            else:
+                warnings += 1
+                level = "warn"
+            print(f"{level}  {name}: full scan of {row['table']} "
+                  f"(~{row['rows']} rows, possible keys: {row['possible_keys']})")
+    return failures, warnings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--database", default="register")
+    args = parser.parse_args()
+
+    connection = mysql.connector.connect(host=args.host, user=args.user,
+                                         password=args.password, database=args.database)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        failures, warnings = check(cursor)
+    finally:
+        cursor.close()
+        connection.close()
+    print(f"{len(QUERIES)} queries checked, {failures} unindexed scans, {warnings} warnings")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
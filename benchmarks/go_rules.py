@@ -0,0 +1,113 @@
+"""Micro-benchmarks for the incremental rules engine in go_rules.py.
+
+Plays random games and reports moves/sec for play() alone and for play()
+plus a full legal_mask() every move, next to a flood-fill capture check of
+the kind the engine replaces. The match runner and tournament workers
+call play() once per move, so its rate is the ceiling on games/sec the
+rules can support.
+
+    python -m <package>.benchmarks.go_rules --games 50
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from ..go_rules import GoEngine
+from ..packed_board import BOARD_SIZE
+
+NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+def flood_fill_play(board, x, y, color):
+    """Capture handling by flood-filling every neighbouring group"""
+    board[y, x] = color
+    size = board.shape[0]
+
+    def group(sy, sx):
+        col = board[sy, sx]
+        seen, stack, has_liberty = {(sy, sx)}, [(sy, sx)], False
+        while stack:
+            cy, cx = stack.pop()
+            for dy, dx in NEIGHBOURS:
+                ny, nx = cy + dy, cx + dx
+                if 0 <= ny < size and 0 <= nx < size:
+                    if board[ny, nx] == 0:
+                        has_liberty = True
+                    elif board[ny, nx] == col and (ny, nx) not in seen:
+                        seen.add((ny, nx))
+                        stack.append((ny, nx))
+        return seen, has_liberty
+
+    for dy, dx in NEIGHBOURS:
+        ny, nx = y + dy, x + dx
+        if 0 <= ny < size and 0 <= nx < size and board[ny, nx] == 3 - color:
+            stones, has_liberty = group(ny, nx)
+            if not has_liberty:
+                for point in stones:
+                    board[point] = 0
+
+
+def record_games(games, max_moves, seed):
+    """Random legal games as move lists, so every variant replays the same moves"""
+    rng = random.Random(seed)
+    recorded = []
+    for _ in range(games):
+        engine, color, moves = GoEngine(), 1, []
+        for _ in range(max_moves):
+            legal = np.flatnonzero(engine.legal_mask(color))
+            if not len(legal):
+                break
+            y, x = divmod(int(legal[rng.randrange(len(legal))]), BOARD_SIZE)
+            engine.play(x, y, color)
+            moves.append((x, y, color))
+            color = 3 - color
+        recorded.append(moves)
+    return recorded
+
+
+def bench(name, games, replay):
+    moves = sum(len(game) for game in games)
+    started = time.perf_counter()
+    for game in games:
+        replay(game)
+    elapsed = time.perf_counter() - started
+    print(f"{name:32s} {moves / elapsed:12,.0f} moves/sec")
+
+
+def replay_engine(game):
+    engine = GoEngine()
+    for x, y, color in game:
+        engine.play(x, y, color)
+
+
+def replay_engine_with_mask(game):
+    engine = GoEngine()
+    for x, y, color in game:
+        engine.legal_mask(color)
+        engine.play(x, y, color)
+
+
+def replay_flood_fill(game):
+    board = np.zeros((BOARD_SIZE, BOARD_SIZE), dtype=np.int8)
+    for x, y, color in game:
+        flood_fill_play(board, x, y, color)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--max-moves", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    games = record_games(args.games, args.max_moves, args.seed)
+    print(f"{args.games} random games, {sum(len(g) for g in games)} moves")
+    bench("flood fill captures", games, replay_flood_fill)
+    bench("engine play()", games, replay_engine)
+    bench("engine play() + legal_mask()", games, replay_engine_with_mask)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""Concurrency load test for matchmaking, game rooms and board broadcasts.
+
+Drives a running server the way browsers do. Every simulated client is
+registered first (first run only), outside the timed phase. Each then logs
+in over HTTP and calls find_match, again every --match-retry seconds until
+it is paired, because a freshly uploaded agent is only queued once the
+server has prepared it. It then opens a Socket.IO connection, joins its game room, requests the board and
+asks the server to play the game out while it records the board_delta /
+board_update stream. Point it at a server configured with a local MySQL,
+or with GAME_STATE_BACKEND='sqlite' for the live-game store.
+
+Per event type it reports count, errors, p50/p95/p99/max latency and
+throughput, and writes everything to a JSON file; --compare prints the
+change against an earlier run.
+
+    python -m <package>.benchmarks.load_test --url http://localhost:5000 \\
+        --clients 200 --output run.json --compare previous.json
+
+Needs the python-socketio client (pip install "python-socketio[client]").
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+
+import socketio
+
+AGENT_SOURCE = b"def get_move(board, player):\n    return None\n"
+
+STREAM_EVENTS = ('board_delta', 'board_update', 'spectator_frame')
+
+
+class Recorder:
+    """Latency samples and stream counts shared by every simulated client"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.received = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def sample(self, event, seconds):
+        with self._lock:
+            self.latencies[event].append(seconds)
+
+    def error(self, event):
+        with self._lock:
+            self.errors[event] += 1
+
+    def receive(self, event):
+        with self._lock:
+            self.received[event] += 1
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class SimulatedClient:
+    def __init__(self, args, index, recorder):
+        self.args = args
+        self.username = f"{args.user_prefix}{index}"
+        self.recorder = recorder
+        self.cookies = http.cookiejar.CookieJar()
+        self.http = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect())
+        self.sio = socketio.Client(reconnection=False)
+        self.replies = {}
+        self.match_ready = threading.Event()
+        self.match_id = None
+        self.game_over = threading.Event()
+
+    def _post(self, path, body, content_type='application/x-www-form-urlencoded'):
+        request = urllib.request.Request(self.args.url + path, data=body, method='POST',
+                                         headers={'Content-Type': content_type})
+        try:
+            response = self.http.open(request, timeout=self.args.timeout)
+        except urllib.error.HTTPError as e:
+            # Redirects surface as HTTPError once NoRedirect declines them
+            response = e
+        return response.status, response.headers.get('Location', '')
+
+    def _timed_post(self, event, path, fields):
+        started = time.perf_counter()
+        try:
+            status, location = self._post(path, urllib.parse.urlencode(fields).encode())
+        except OSError:
+            self.recorder.error(event)
+            return None
+        self.recorder.sample(event, time.perf_counter() - started)
+        if status >= 400:
+            self.recorder.error(event)
+            return None
+        return location
+
+    def register(self):
+        boundary = uuid.uuid4().hex
+        parts = []
+        for name, value in (('username', self.username), ('email', f"{self.username}@load.test"),
+                            ('password', self.args.password)):
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                         f'{value}\r\n'.encode())
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="agentFile"; '
+                     f'filename="agent.py"\r\nContent-Type: text/x-python\r\n\r\n'.encode()
+                     + AGENT_SOURCE + b'\r\n')
+        parts.append(f'--{boundary}--\r\n'.encode())
+        try:
+            self._post(self.args.register_path, b''.join(parts),
+                       f'multipart/form-data; boundary={boundary}')
+        except OSError:
+            self.recorder.error('register')
+
+    def _on_reply(self, event):
+        def handler(data=None):
+            waiter = self.replies.pop(event, None)
+            if waiter is not None:
+                waiter.set()
+        return handler
+
+    def _emit_and_wait(self, event, reply_event, payload):
+        """Time an emit until the server's reply event arrives"""
+        waiter = self.replies[reply_event] = threading.Event()
+        started = time.perf_counter()
+        self.sio.emit(event, payload)
+        if waiter.wait(self.args.timeout):
+            self.recorder.sample(event, time.perf_counter() - started)
+        else:
+            self.replies.pop(reply_event, None)
+            self.recorder.error(event)
+
+    def _connect_socket(self):
+        self.sio.on('game_joined', self._on_reply('game_joined'))
+        self.sio.on('match_running', self._on_reply('match_running'))
+        board_reply = self._on_reply('board_update')
+
+        def on_match_ready(data):
+            self.match_id = self.match_id or data.get('match_id')
+            self.match_ready.set()
+
+        def stream(event):
+            def handler(data):
+                self.recorder.receive(event)
+                if event == 'board_update':
+                    board_reply(data)
+                if isinstance(data, dict) and data.get('game_over'):
+                    self.game_over.set()
+            return handler
+
+        self.sio.on('match_ready', on_match_ready)
+        for event in STREAM_EVENTS:
+            self.sio.on(event, stream(event))
+        cookie = '; '.join(f"{c.name}={c.value}" for c in self.cookies)
+        started = time.perf_counter()
+        self.sio.connect(self.args.url, headers={'Cookie': cookie},
+                         wait_timeout=self.args.timeout)
+        self.recorder.sample('connect', time.perf_counter() - started)
+
+    def find_match(self):
+        """Call find_match until paired; a repeat is a no-op once queued"""
+        deadline = time.perf_counter() + self.args.timeout
+        while True:
+            location = self._timed_post('find_match', self.args.find_match_path, {})
+            found = re.search(r'(\d+)/?$', location or '')
+            if found and 'game' in location:
+                self.match_id = int(found.group(1))
+                return True
+            wait = min(self.args.match_retry, deadline - time.perf_counter())
+            if wait <= 0:
+                return False
+            if self.match_ready.wait(wait):
+                return True
+
+    def run(self):
+        if self._timed_post('login', self.args.login_path,
+                            {'username': self.username, 'password': self.args.password}) is None:
+            return
+        try:
+            self._connect_socket()
+        except Exception:
+            self.recorder.error('connect')
+            return
+        try:
+            started = time.perf_counter()
+            if not self.find_match():
+                self.recorder.error('paired')
+                return
+            self.recorder.sample('paired', time.perf_counter() - started)
+
+            payload = {'match_id': self.match_id}
+            self._emit_and_wait('join_game', 'game_joined', payload)
+            self._emit_and_wait('request_board_state', 'board_update', payload)
+            if self.args.play:
+                self._emit_and_wait('run_match', 'match_running', payload)
+                self.game_over.wait(self.args.game_timeout)
+        finally:
+            self.sio.disconnect()
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def summarize(recorder, elapsed):
+    events = {}
+    for event in sorted(set(recorder.latencies) | set(recorder.errors)):
+        ordered = sorted(recorder.latencies.get(event, ()))
+        events[event] = {
+            'count': len(ordered),
+            'errors': recorder.errors.get(event, 0),
+            'p50_ms': _ms(percentile(ordered, 0.50)),
+            'p95_ms': _ms(percentile(ordered, 0.95)),
+            'p99_ms': _ms(percentile(ordered, 0.99)),
+            'max_ms': _ms(ordered[-1] if ordered else None),
+            'per_sec': round(len(ordered) / elapsed, 2),
+        }
+    streams = {event: {'received': count, 'per_sec': round(count / elapsed, 2)}
+               for event, count in sorted(recorder.received.items())}
+    return events, streams
+
+
+def compare(current, previous):
+    print(f"\nchange vs {previous['started_at']}:")
+    for event, stats in current['events'].items():
+        before = previous['events'].get(event)
+        if not before or not before['p95_ms'] or not stats['p95_ms']:
+            continue
+        change = (stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        print(f"  {event:20s} p95 {before['p95_ms']:9.1f} -> {stats['p95_ms']:9.1f} ms ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--ramp-seconds", type=float, default=5.0,
+                        help="spread client start-up over this many seconds")
+    parser.add_argument("--user-prefix", default="loadtest_")
+    parser.add_argument("--password", default="loadtest")
+    parser.add_argument("--no-register", dest="register", action="store_false",
+                        help="users already exist from an earlier run")
+    parser.add_argument("--no-play", dest="play", action="store_false",
+                        help="skip run_match and the board stream")
+    parser.add_argument("--register-path", default="/auth/register")
+    parser.add_argument("--login-path", default="/auth/login")
+    parser.add_argument("--find-match-path", default="/find_match")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--match-retry", type=float, default=1.0,
+                        help="seconds between find_match calls while unpaired")
+    parser.add_argument("--game-timeout", type=float, default=120.0)
+    parser.add_argument("--output", default="load_test.json")
+    parser.add_argument("--compare", help="earlier JSON result to compare against")
+    args = parser.parse_args()
+    args.url = args.url.rstrip('/')
+
+    recorder = Recorder()
+    clients = [SimulatedClient(args, i, recorder) for i in range(args.clients)]
+    if args.register:
+        # Untimed setup: every upload is identical, so the server prepares one agent
+        setup = [threading.Thread(target=client.register, daemon=True) for client in clients]
+        for thread in setup:
+            thread.start()
+        for thread in setup:
+            thread.join()
+    threads = [threading.Thread(target=client.run, daemon=True) for client in clients]
+    started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+        time.sleep(args.ramp_seconds / max(args.clients, 1))
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    events, streams = summarize(recorder, elapsed)
+    result = {
+        'started_at': started_at,
+        'url': args.url,
+        'clients': args.clients,
+        'elapsed_s': round(elapsed, 3),
+        'events': events,
+        'streams': streams,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    print(f"{args.clients} clients in {elapsed:.1f}s")
+    print(f"{'event':20s} {'count':>7s} {'errors':>7s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'/s':>8s}")
+    for event, stats in events.items():
+        row = [stats[key] if stats[key] is not None else float('nan')
+               for key in ('p50_ms', 'p95_ms', 'p99_ms')]
+        print(f"{event:20s} {stats['count']:7d} {stats['errors']:7d} "
+              f"{row[0]:9.1f} {row[1]:9.1f} {row[2]:9.1f} {stats['per_sec']:8.1f}")
+    for event, stats in streams.items():
+        print(f"{event:20s} received {stats['received']} ({stats['per_sec']}/s)")
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
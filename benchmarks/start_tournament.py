@@ -0,0 +1,184 @@
+"""Wall-clock benchmark for tournament.start_tournament.
+
+Builds a 2048-player tournament in an in-memory SQLite stand-in for the
+MySQL schema and times the per-row bracket creation the app used to do
+against the bulk version in tournament.py. SQLite has no network round
+trip, so --latency-ms adds a fixed delay per statement to approximate one.
+
+    python -m <package>.benchmarks.start_tournament --latency-ms 0.3
+"""
+import argparse
+import random
+import re
+import sqlite3
+import time
+from datetime import datetime
+
+from ..tournament import BRACKET_SIZE, start_tournament
+
+SCHEMA = """
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        elo INTEGER DEFAULT 1500
+    );
+    CREATE TABLE matches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        player1_id INTEGER,
+        player2_id INTEGER,
+        status TEXT DEFAULT 'waiting',
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE tournaments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        status TEXT DEFAULT 'upcoming',
+        start_date TEXT,
+        max_participants INTEGER NOT NULL,
+        current_participants INTEGER DEFAULT 0
+    );
+    CREATE TABLE tournament_participants (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tournament_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        seed INTEGER,
+        status TEXT DEFAULT 'active'
+    );
+    CREATE TABLE tournament_matches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tournament_id INTEGER NOT NULL,
+        match_id INTEGER NOT NULL,
+        round INTEGER NOT NULL,
+        position INTEGER NOT NULL
+    );
+"""
+
+
+class StandInCursor:
+    """Dictionary cursor speaking the MySQL dialect used by tournament.py"""
+
+    def __init__(self, conn, latency):
+        self._cursor = conn.cursor()
+        self.latency = latency
+        self.statements = 0
+        # MySQL's LAST_INSERT_ID() is the first id of the last INSERT, where
+        # SQLite's last_insert_rowid() is its last
+        self._first_insert_id = 0
+        conn.create_function("LAST_INSERT_ID", 0, lambda: self._first_insert_id)
+
+    def execute(self, sql, params=()):
+        sql = re.sub(r"\s+FOR UPDATE", "", sql).replace("%s", "?")
+        self.statements += 1
+        if self.latency:
+            time.sleep(self.latency)
+        self._cursor.execute(sql, tuple(params))
+        if sql.lstrip().upper().startswith("INSERT") and self._cursor.rowcount > 0:
+            self._first_insert_id = self._cursor.lastrowid - self._cursor.rowcount + 1
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return dict(row) if row is not None else None
+
+    def fetchall(self):
+        return [dict(row) for row in self._cursor.fetchall()]
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+
+def make_database():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.create_function("NOW", 0, lambda: datetime.now().isoformat(" "))
+    conn.executescript(SCHEMA)
+    rng = random.Random(2048)
+    conn.executemany("INSERT INTO users (username, elo) VALUES (?, ?)",
+                     [(f"agent{i}", rng.randint(900, 2400)) for i in range(BRACKET_SIZE)])
+    conn.execute("INSERT INTO tournaments (name, max_participants) VALUES ('bench', ?)",
+                 (BRACKET_SIZE,))
+    conn.executemany("INSERT INTO tournament_participants (tournament_id, user_id) VALUES (1, ?)",
+                     [(i,) for i in range(1, BRACKET_SIZE + 1)])
+    conn.commit()
+    return conn
+
+
+def legacy_start_tournament(db, cursor, tournament_id):
+    """The original row-at-a-time bracket creation, kept for comparison"""
+    cursor.execute("SELECT * FROM tournaments WHERE id = %s AND status = 'upcoming'",
+                   (tournament_id,))
+    if not cursor.fetchone():
+        return False
+    cursor.execute("""
+        SELECT tp.id, tp.user_id, u.username, u.elo
+        FROM tournament_participants tp
+        JOIN users u ON tp.user_id = u.id
+        WHERE tp.tournament_id = %s
+        ORDER BY u.elo DESC
+    """, (tournament_id,))
+    participants = cursor.fetchall()
+    for seed, participant in enumerate(participants, 1):
+        cursor.execute("UPDATE tournament_participants SET seed = %s WHERE id = %s",
+                       (seed, participant['id']))
+    db.commit()
+    for i in range(0, 2048, 2):
+        cursor.execute("INSERT INTO matches (player1_id, player2_id, status) VALUES (%s, %s, 'active')",
+                       (participants[i]['user_id'], participants[i + 1]['user_id']))
+        cursor.execute("INSERT INTO tournament_matches (tournament_id, match_id, round, position) "
+                       "VALUES (%s, %s, %s, %s)", (tournament_id, cursor.lastrowid, 1, i // 2))
+    for current_round in range(2, 12):
+        for pos in range(2048 // (2 ** current_round)):
+            cursor.execute("INSERT INTO matches (status) VALUES ('waiting')")
+            cursor.execute("INSERT INTO tournament_matches (tournament_id, match_id, round, position) "
+                           "VALUES (%s, %s, %s, %s)", (tournament_id, cursor.lastrowid, current_round, pos))
+    cursor.execute("UPDATE tournaments SET status = 'active', start_date = NOW() WHERE id = %s",
+                   (tournament_id,))
+    db.commit()
+    return True
+
+
+def bracket_fingerprint(conn):
+    """Seeds and (round, position) -> players, to check both versions agree"""
+    seeds = conn.execute("SELECT user_id, seed FROM tournament_participants ORDER BY user_id").fetchall()
+    slots = conn.execute("""
+        SELECT tm.round, tm.position, m.player1_id, m.player2_id, m.status
+        FROM tournament_matches tm JOIN matches m ON m.id = tm.match_id
+        ORDER BY tm.round, tm.position
+    """).fetchall()
+    return [tuple(r) for r in seeds], [tuple(r) for r in slots]
+
+
+def run(impl, latency, repeat):
+    best, statements, fingerprint = None, 0, None
+    for _ in range(repeat):
+        conn = make_database()
+        cursor = StandInCursor(conn, latency)
+        started = time.perf_counter()
+        assert impl(conn, cursor, 1), f"{impl.__name__} failed"
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        statements = cursor.statements
+        fingerprint = bracket_fingerprint(conn)
+        conn.close()
+    return best, statements, fingerprint
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="simulated client/server round trip per statement")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000.0
+
+    before, before_stmts, before_fp = run(legacy_start_tournament, latency, args.repeat)
+    after, after_stmts, after_fp = run(start_tournament, latency, args.repeat)
+
+    print(f"players: {BRACKET_SIZE}  simulated latency: {args.latency_ms} ms/statement")
+    print(f"before: {before * 1000:9.1f} ms  {before_stmts:5d} statements")
+    print(f"after:  {after * 1000:9.1f} ms  {after_stmts:5d} statements")
+    print(f"speedup: {before / after:.1f}x  brackets identical: {before_fp == after_fp}")
+
+
+if __name__ == "__main__":
+    main()
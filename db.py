@@ -1,45 +1,56 @@
+"""Versioned schema migrations for the MySQL database.
+
+Each migration runs once and is recorded in schema_migrations. Every step
+is written so it can be re-run safely, because MySQL DDL commits implicitly
+and a migration that failed halfway must be retryable.
+"""
+import logging
+
+import click
 import mysql.connector
 from mysql.connector import Error
 
-connection = None
+from .metrics import log_error, log_event
 
-try:
-    # Connect to MySQL server (no database specified)
-    connection = mysql.connector.connect(
-        host='localhost',
-        user='root',
-        password=''
-    )
 
-    if connection.is_connected():
-        print("Connected to MySQL server")
+def create_table(ddl):
+    return lambda cursor, database: cursor.execute(ddl)
 
-        # Create a cursor object
-        cursor = connection.cursor()
 
-        # Create a new database
-        cursor.execute("CREATE DATABASE IF NOT EXISTS register")
-        print("Database 'register' created (if it did not exist)")
+def add_column(table, column, definition):
+    def step(cursor, database):
+        if not _exists(cursor, """
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = %s AND table_name = %s AND column_name = %s
+        """, (database, table, column)):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
 
-        # Show all databases to confirm
-        cursor.execute("SHOW DATABASES")
-        for db in cursor:
-            print(db)
-        
-        cursor.close()
-        connection.close()
 
-        connection = mysql.connector.connect(
-            host='localhost',
-            user='root',
-            password='',
-            database='register'
-        )
+def modify_column(table, column, definition):
+    return lambda cursor, database: cursor.execute(
+        f"ALTER TABLE {table} MODIFY COLUMN {column} {definition}")
 
-        cursor = connection.cursor()
 
-        # Create a new table
-        cursor.execute("""
+def add_index(table, name, columns, unique=False):
+    def step(cursor, database):
+        if not _exists(cursor, """
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = %s AND table_name = %s AND index_name = %s
+        """, (database, table, name)):
+            kind = "UNIQUE INDEX" if unique else "INDEX"
+            cursor.execute(f"CREATE {kind} {name} ON {table} ({columns})")
+    return step
+
+
+def _exists(cursor, query, params):
+    cursor.execute(query, params)
+    return cursor.fetchone() is not None
+
+
+MIGRATIONS = [
+    (1, "initial schema", [
+        create_table("""
             CREATE TABLE IF NOT EXISTS users (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 username VARCHAR(100) NOT NULL,
@@ -48,10 +59,8 @@ try:
                 elo INT DEFAULT 1500,
                 agentFile VARCHAR(255)
             )
-        """)
-        print("Table 'users' created (if it did not exist)")
-
-        cursor.execute("""
+        """),
+        create_table("""
             CREATE TABLE IF NOT EXISTS matches (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 player1_id INT NOT NULL,
@@ -61,15 +70,9 @@ try:
                 FOREIGN KEY (player1_id) REFERENCES users(id),
                 FOREIGN KEY (player2_id) REFERENCES users(id)
             )
-        """)
-
-        cursor.execute("""
-            ALTER TABLE users 
-            ADD COLUMN current_match INT REFERENCES matches(id);
-            """)  # [4]
-
-        # Add to db.py after creating users and matches tables
-        cursor.execute("""
+        """),
+        add_column('users', 'current_match', "INT REFERENCES matches(id)"),
+        create_table("""
             CREATE TABLE IF NOT EXISTS tournaments (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 name VARCHAR(255) NOT NULL,
@@ -81,9 +84,8 @@ try:
                 max_participants INT NOT NULL,
                 current_participants INT DEFAULT 0
             )
-        """)
-
-        cursor.execute("""
+        """),
+        create_table("""
             CREATE TABLE IF NOT EXISTS tournament_participants (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 tournament_id INT NOT NULL,
@@ -94,9 +96,8 @@ try:
                 FOREIGN KEY (tournament_id) REFERENCES tournaments(id),
                 FOREIGN KEY (user_id) REFERENCES users(id)
             )
-        """)
-
-        cursor.execute("""
+        """),
+        create_table("""
             CREATE TABLE IF NOT EXISTS tournament_matches (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 tournament_id INT NOT NULL,
@@ -107,16 +108,130 @@ try:
                 FOREIGN KEY (tournament_id) REFERENCES tournaments(id),
                 FOREIGN KEY (match_id) REFERENCES matches(id)
             )
-        """)
+        """),
+        # Compacted from the per-match move journals (move_journal.py)
+        create_table("""
+            CREATE TABLE IF NOT EXISTS moves (
+                match_id INT NOT NULL,
+                move_number INT NOT NULL,
+                x TINYINT,
+                y TINYINT,
+                color TINYINT NOT NULL,
+                clock_ms INT,
+                PRIMARY KEY (match_id, move_number),
+                FOREIGN KEY (match_id) REFERENCES matches(id)
+            )
+        """),
+    ]),
+    (2, "indexes for matchmaking and match lookups", [
+        add_index('matches', 'idx_matches_status', 'status'),
+        add_index('matches', 'idx_matches_player1_status', 'player1_id, status'),
+        add_index('matches', 'idx_matches_player2_status', 'player2_id, status'),
+        add_index('users', 'idx_users_elo', 'elo'),
+    ]),
+    (3, "unique usernames and tournament registrations", [
+        add_index('users', 'uq_users_username', 'username', unique=True),
+        add_index('tournament_participants', 'uq_participants_tournament_user',
+                  'tournament_id, user_id', unique=True),
+        add_index('tournament_matches', 'uq_tournament_matches_slot',
+                  'tournament_id, round, position', unique=True),
+    ]),
+    (4, "tournament slots are created before their players are known", [
+        modify_column('matches', 'player1_id', "INT NULL"),
+    ]),
+    (5, "keyset pagination of participants and the tournament list", [
+        add_index('tournament_participants', 'idx_participants_tournament_id',
+                  'tournament_id, id'),
+        add_index('tournaments', 'idx_tournaments_created_at', 'created_at'),
+    ]),
+    (6, "content-addressed agent store", [
+        create_table("""
+            CREATE TABLE IF NOT EXISTS agents (
+                hash CHAR(64) PRIMARY KEY,
+                status ENUM('pending', 'ready', 'failed') DEFAULT 'pending',
+                error TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """),
+        add_column('users', 'agent_hash', "CHAR(64)"),
+    ]),
+    (7, "finished games keep their result for export", [
+        add_column('matches', 'winner', "TINYINT"),
+        add_column('matches', 'ended_at', "DATETIME"),
+    ]),
+    (8, "matches and tournaments that could not be played", [
+        modify_column('matches', 'status',
+                      "ENUM('waiting', 'active', 'completed', 'error') DEFAULT 'waiting'"),
+        modify_column('tournaments', 'status',
+                      "ENUM('upcoming', 'active', 'completed', 'error') DEFAULT 'upcoming'"),
+    ]),
+]
+
+
+def connect(config, database=None):
+    return mysql.connector.connect(
+        host=config['DB_HOST'],
+        user=config['DB_USER'],
+        password=config['DB_PASSWORD'],
+        database=database,
+    )
 
 
-except Error as e:
-    print("Error while connecting to MySQL", e)
+def migrate(config, target=None):
+    """Apply every pending migration up to target; returns the versions applied"""
+    database = config['DB_NAME']
+    server = connect(config)
+    try:
+        cursor = server.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database}")
+        cursor.close()
+    finally:
+        server.close()
 
-finally:
-    if connection is not None and connection.is_connected():
+    connection = connect(config, database)
+    cursor = connection.cursor()
+    applied = []
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                description VARCHAR(255) NOT NULL,
+                applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("SELECT version FROM schema_migrations")
+        done = {row[0] for row in cursor.fetchall()}
+
+        for version, description, steps in MIGRATIONS:
+            if version in done or (target is not None and version > target):
+                continue
+            for step in steps:
+                step(cursor, database)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                (version, description))
+            connection.commit()
+            applied.append(version)
+            # Above INFO, so a schema change is never sampled out of the log
+            log_event("migration_applied", logging.WARNING, version=version,
+                      description=description)
+    finally:
+        cursor.close()
         connection.close()
-        print("MySQL connection is closed")
-
-
-
+    return applied
+
+
+def init_app(app):
+    """Register `flask migrate` and, unless DB_AUTO_MIGRATE is off, migrate on startup"""
+    @app.cli.command('migrate')
+    @click.option('--target', type=int, default=None, help='Stop after this version.')
+    def migrate_command(target):
+        """Apply pending schema migrations."""
+        applied = migrate(app.config, target)
+        click.echo(f"{len(applied)} migration(s) applied")
+
+    if app.config.setdefault('DB_AUTO_MIGRATE', True):
+        try:
+            migrate(app.config)
+        except Error as e:
+            log_error("migration_failed", e)
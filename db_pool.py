@@ -0,0 +1,204 @@
+import os
+import queue
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import Error
+from flask import current_app, g
+
+from .metrics import TimedCursor
+
+
+class PoolExhausted(Error):
+    """Raised when no connection becomes free within DB_POOL_TIMEOUT"""
+
+
+class PooledConnection:
+    """Connection lent out by the pool; close() hands it back instead of closing"""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise Error("Connection already returned to the pool")
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self.__getattr__('cursor')(*args, **kwargs)
+        return TimedCursor(cursor) if self._pool.timed else cursor
+
+    @property
+    def returned(self):
+        return self._raw is None
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw)
+
+
+class ConnectionPool:
+    """Fixed-size MySQL connection pool shared by routes and Socket.IO events"""
+
+    def __init__(self, size=10, timeout=5.0, connect_timeout=5, recycle=1800,
+                 timed=False, **connect_args):
+        self.size = size
+        self.timed = timed
+        self.timeout = timeout
+        self.recycle = recycle
+        self.connect_args = dict(connect_args, connection_timeout=connect_timeout)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'exhausted': 0,
+            'created': 0,
+            'discarded': 0,
+            'in_use': 0,
+        }
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self.stats[key] += delta
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.connect_args)
+        raw._pool_created_at = time.monotonic()
+        self._count('created')
+        return raw
+
+    def _healthy(self, raw):
+        """Cheap liveness check on checkout; stale or broken sockets are dropped"""
+        if time.monotonic() - raw._pool_created_at > self.recycle:
+            return False
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
+    def _discard(self, raw):
+        self._count('discarded')
+        try:
+            raw.close()
+        except Error:
+            pass
+
+    def acquire(self):
+        if not self._slots.acquire(blocking=False):
+            self._count('waits')
+            if not self._slots.acquire(timeout=self.timeout):
+                self._count('exhausted')
+                raise PoolExhausted(
+                    f"No database connection free after {self.timeout}s "
+                    f"(pool size {self.size})"
+                )
+        try:
+            raw = None
+            while raw is None:
+                try:
+                    raw = self._idle.get_nowait()
+                except queue.Empty:
+                    raw = self._connect()
+                    break
+                if not self._healthy(raw):
+                    self._discard(raw)
+                    raw = None
+        except Exception:
+            self._slots.release()
+            raise
+        self._count('checkouts')
+        self._count('in_use')
+        return PooledConnection(self, raw)
+
+    def release(self, raw):
+        try:
+            # Never hand the next borrower someone else's open transaction
+            raw.rollback()
+            self._idle.put(raw)
+        except Error:
+            self._discard(raw)
+        finally:
+            self._count('in_use', -1)
+            self._slots.release()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['idle'] = self._idle.qsize()
+        stats['size'] = self.size
+        return stats
+
+    def close_all(self):
+        while True:
+            try:
+                raw = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(raw)
+
+
+def init_app(app):
+    """Create the app-wide pool from app.config and return borrowed connections on teardown"""
+    app.config.setdefault('DB_HOST', 'localhost')
+    app.config.setdefault('DB_USER', 'root')
+    app.config.setdefault('DB_PASSWORD', '')
+    app.config.setdefault('DB_NAME', 'register')
+    app.config.setdefault('DB_POOL_SIZE', 10)
+    app.config.setdefault('DB_POOL_TIMEOUT', 5.0)
+    app.config.setdefault('DB_CONNECT_TIMEOUT', 5)
+    app.config.setdefault('DB_POOL_RECYCLE', 1800)
+    app.config.setdefault('DB_QUERY_TIMING', True)
+    # The C extension blocks the whole process; the pure-Python driver goes
+    # through the (green, when patched) socket module
+    app.config.setdefault('DB_USE_PURE', bool(os.environ.get('AGL_ASYNC_MODE')))
+
+    app.extensions['db_pool'] = ConnectionPool(
+        size=app.config['DB_POOL_SIZE'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        connect_timeout=app.config['DB_CONNECT_TIMEOUT'],
+        recycle=app.config['DB_POOL_RECYCLE'],
+        timed=app.config['DB_QUERY_TIMING'],
+        host=app.config['DB_HOST'],
+        user=app.config['DB_USER'],
+        password=app.config['DB_PASSWORD'],
+        database=app.config['DB_NAME'],
+        use_pure=app.config['DB_USE_PURE'],
+    )
+    app.teardown_appcontext(release_connections)
+
+
+def get_pool(app=None):
+    return (app or current_app).extensions['db_pool']
+
+
+def get_db():
+    """Borrow a pooled connection for the current request or Socket.IO event.
+
+    Calling close() returns it to the pool; anything still borrowed when the
+    app context ends is returned automatically.
+    """
+    conn = get_pool().acquire()
+    g.setdefault('_db_borrowed', []).append(conn)
+    return conn
+
+
+def bulk_insert(cursor, prefix, placeholder, rows, chunk_size=500):
+    """Insert rows with as few multi-row INSERT statements as possible"""
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        cursor.execute(
+            prefix + " VALUES " + ", ".join([placeholder] * len(chunk)),
+            [value for row in chunk for value in row]
+        )
+
+
+def release_connections(exc=None):
+    for conn in g.pop('_db_borrowed', ()):
+        if not conn.returned:
+            conn.close()
@@ -1,20 +1,129 @@
-def broadcast_board_update(socketio, match_id, game):
-    room_name = f"game_{match_id}"
-    board_data = {
+import time
+
+from .game_clock import clock_payload, commit_move, stop_clock
+from .metrics import log_event
+from .move_journal import move_journal
+from .packed_board import PackedBoard
+from .replay import history_page, replay_store
+from .spectator import spectator_channel
+
+# match_id -> last board broadcast to the room, kept by the process driving the game
+broadcast_boards = {}
+
+
+def _last_broadcast(match_id, game):
+    board = broadcast_boards.get(match_id)
+    if board is None:
+        board = broadcast_boards[match_id] = PackedBoard(game.board.shape[0])
+    return board
+
+
+def board_snapshot(match_id, game):
+    """Full board state, used for initial loads and resyncs after a sequence gap.
+
+    The sequence number lives on the game itself so every server process
+    hands out snapshots that line up with the deltas sent by the process
+    driving the game.
+    """
+    return {
+        'seq': getattr(game, 'board_seq', 0),
         'board': game.board.tolist(),
         'current_player': game.current_player,
-        'move_history': game.move_history[-1] if game.move_history else None,
+        # Only the latest page; older moves come from request_move_history
+        **history_page(game),
         'game_over': game.game_over,
         'result_message': game.result_message,
-        'last_move': game.move_history[-1] if game.move_history else None
+        'clock': clock_payload(match_id)
     }
-    socketio.emit('board_update', board_data, room=room_name)
-    print(f"Broadcasting board update to room {room_name}")
+
+
+def board_delta(match_id, game, changes=None):
+    """Placed stone and captured points since the last broadcast, or None if
+    the change is not a single move and clients need a snapshot instead"""
+    last = _last_broadcast(match_id, game)
+    if changes is None:
+        changes = last.diff(game.board)
+    stone, captured = None, []
+    for y, x, color in changes:
+        if not color:
+            captured.append([x, y])
+        elif stone is None:
+            stone = [x, y, color]
+        else:
+            return None
+    for y, x, color in changes:
+        last[y, x] = color
+    game.board_seq = getattr(game, 'board_seq', 0) + 1
+    return {
+        'seq': game.board_seq,
+        'stone': stone,
+        'captured': captured,
+        'current_player': game.current_player,
+        'game_over': game.game_over,
+        'result_message': game.result_message,
+        'last_move': game.move_history[-1] if game.move_history else None,
+        'clock': clock_payload(match_id)
+    }
+
+
+def forget_board(match_id):
+    """Drop the per-game broadcast state once a game is over"""
+    broadcast_boards.pop(match_id, None)
+    replay_store.forget(match_id)
+
+
+def _journal(match_id, game, changes):
+    """Append the newly committed move (and game end) to the match journal"""
+    if not move_journal.enabled:
+        return
+    moves = len(game.move_history)
+    journaled = getattr(game, 'journaled_moves', 0)
+    if moves > journaled:
+        clock = clock_payload(match_id)
+        clock_ms = 0
+        if clock:
+            clock_ms = clock['white_ms'] if game.current_player == 1 else clock['black_ms']
+        move_journal.record_moves(match_id, journaled + 1, game.move_history[journaled:],
+                                  changes, clock_ms)
+        game.journaled_moves = moves
+    if game.game_over and not getattr(game, 'journal_closed', False):
+        move_journal.record_game_over(match_id, moves)
+        game.journal_closed = True
+
+
+def broadcast_board_update(socketio, match_id, game):
+    room_name = f"game_{match_id}"
+    # The move is committed now: charge the mover's time before sending it
+    stopped = None
+    if game.game_over:
+        stopped = stop_clock(match_id)
+    else:
+        commit_move(match_id, game.current_player)
+    changes = _last_broadcast(match_id, game).diff(game.board)
+    _journal(match_id, game, changes)
+    replay_store.record(match_id, game, changes)
+    delta = board_delta(match_id, game, changes)
+    if delta is not None:
+        event = 'board_delta'
+    else:
+        _last_broadcast(match_id, game).assign(game.board)
+        game.board_seq = getattr(game, 'board_seq', 0) + 1
+        event, delta = 'board_update', board_snapshot(match_id, game)
+    if stopped is not None:
+        # The clock has left the registry; send its final, stopped reading
+        delta['clock'] = stopped.to_payload(time.monotonic())
+    socketio.emit(event, delta, room=room_name)
+    spectator_channel.publish(match_id, game)
+    # Every way a game ends (the runner's last move, a flag-fall, a
+    # resignation) broadcasts the final board through here
+    if game.game_over:
+        forget_board(match_id)
 
 def broadcast_clock_update(socketio, match_id, current_player):
     room_name = f"game_{match_id}"
     socketio.emit('auto_clock_switch', {
         'current_player': current_player,
-        'match_id': match_id
+        'match_id': match_id,
+        'clock': clock_payload(match_id)
     }, to=room_name)
-    print(f"Broadcasting clock switch to room {room_name}, next player: {current_player}")
+    log_event("clock_switch", room=room_name, next_player=current_player)
@@ -1,3 +1,6 @@
+// Display-only clocks. Remaining time comes from the server, attached to
+// board_update / board_delta / clock_update / flag_fall events; the local
+// interval just animates the countdown between moves.
 class Player {
   constructor(element, minutes = 1) {
     this.element = element;
@@ -18,13 +21,18 @@ class Player {
   }
 
   tick() {
-    this.seconds--;
+    this.seconds = Math.max(0, this.seconds - 1);
     this.updateClock();
     if (this.seconds <= 0) {
       this.stopClock();
     }
   }
 
+  setMilliseconds(ms) {
+    this.seconds = Math.ceil(ms / 1000);
+    this.updateClock();
+  }
+
   updateClock() {
     const minutes = Math.floor(this.seconds / 60);
     const seconds = this.seconds % 60;
@@ -32,7 +40,7 @@ class Player {
   }
 }
 
-let currentPlayer = 2; // 1 = black, 2 = white
+let currentPlayer = 1; // 1 = black, 2 = white
 var match_id = null;
 const blackPlayer = new Player(document.getElementById('black-clock'), 10);
 const whitePlayer = new Player(document.getElementById('white-clock'), 10);
@@ -41,62 +49,33 @@ const whitePlayer = new Player(document.getElementById('white-clock'), 10);
 blackPlayer.updateClock();
 whitePlayer.updateClock();
 
+function applyServerClock(clock) {
+  if (!clock) return;
+  blackPlayer.setMilliseconds(clock.black_ms);
+  whitePlayer.setMilliseconds(clock.white_ms);
+  currentPlayer = clock.turn;
+  blackPlayer.stopClock();
+  whitePlayer.stopClock();
+  if (clock.running) {
+    (clock.turn === 1 ? blackPlayer : whitePlayer).startClock();
+  }
+}
+
 socket.on('game_joined', function(data) {
   const parts = data.room.split('_');
   match_id = parseInt(parts[1], 10);
-  console.log("Received match_id:", match_id);
-})
-
-// Listen for automatic clock switches triggered by moves
-socket.on('auto_clock_switch', function(data) {
-    console.log("Auto clock switch triggered for player:", data.next_player);
-    const current_player = data.current_player;
-    // Stop current player's clock and start next player's clock
-    if (current_player === 1) {
-        // Next player is black, so white just moved
-        whitePlayer.stopClock();
-        blackPlayer.startClock();
-        currentPlayer = 1;
-    } else {
-        // Next player is white, so black just moved
-        blackPlayer.stopClock();
-        whitePlayer.startClock();
-        currentPlayer = 2;
-    }
-    
-    // Emit the clock state update
-    const activePlayer = currentPlayer === 1 ? blackPlayer : whitePlayer;
-    socket.emit("updateClock", {
-        match_id: data.match_id,
-        player: currentPlayer,
-        minutes: Math.floor(activePlayer.seconds / 60),
-        seconds: activePlayer.seconds % 60
-    });
 });
 
-socket.on('clock_update', function(data) {
-  console.log("Station Number1");
-  if (data.player === 1) {
-    blackPlayer.seconds = data.minutes * 60 + data.seconds;
-    blackPlayer.updateClock();
-
-  } else if (data.player === 2) {
-    whitePlayer.seconds = data.minutes * 60 + data.seconds;
-    whitePlayer.updateClock();
+function applyBoardClock(data) {
+  applyServerClock(data.clock);
+  if (data.game_over) {
+    blackPlayer.stopClock();
+    whitePlayer.stopClock();
   }
-});
-
-
-document.getElementById('next-move-btn').addEventListener('click', function(){
-
-  currentPlayer = currentPlayer === 1 ? 2 : 1;
-
-  const activePlayer = currentPlayer === 1 ? blackPlayer : whitePlayer;
+}
 
-  socket.emit("updateClock", {
-    match_id: match_id,
-    player: currentPlayer,
-    minutes: Math.floor(activePlayer.seconds / 60),
-    seconds: activePlayer.seconds % 60
-  });
-});
+socket.on('board_update', applyBoardClock);
+socket.on('board_delta', applyBoardClock);
+socket.on('auto_clock_switch', function(data) { applyServerClock(data.clock); });
+socket.on('clock_update', applyServerClock);
+socket.on('flag_fall', applyServerClock);
@@ -0,0 +1,337 @@
+import mmap
+import os
+import string
+import struct
+
+import click
+import numpy as np
+from flask import Blueprint, Response, jsonify, stream_with_context
+
+from .db_pool import get_db
+from .go_rules import GoEngine
+from .move_journal import PASS_POINT
+from .packed_board import BLACK, BOARD_SIZE, EMPTY, WHITE
+from .scoring import KOMI
+
+bp_archive = Blueprint('archive', __name__, url_prefix='/archive')
+
+SGF_MIMETYPE = 'application/x-go-sgf'
+SGF_RESULTS = {BLACK: 'B+', WHITE: 'W+', EMPTY: '0'}
+
+# Archive layout: header, then each game's moves as little-endian uint16
+# points (y * size + x, PASS_POINT for a pass, colours alternate from
+# black), then the index sorted by match id. The index carries every
+# game's metadata and byte offset, so a reader finds a game with one
+# binary search and move n of it at offset + 2 * n.
+MAGIC = b'AGLA'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIQ')  # magic, version, board size, games, index offset
+INDEX_DTYPE = np.dtype([
+    ('match_id', '<u4'),
+    ('black_id', '<u4'),
+    ('white_id', '<u4'),
+    ('winner', 'u1'),
+    ('pad', 'u1', (3,)),
+    ('moves', '<u4'),
+    ('offset', '<u8'),
+])
+NO_WINNER = 0xFF
+
+GAME_QUERY = """
+    SELECT m.id, m.player1_id, m.player2_id, m.winner, m.created_at, m.ended_at,
+           b.username AS black, w.username AS white
+    FROM matches m
+    LEFT JOIN users b ON b.id = m.player1_id
+    LEFT JOIN users w ON w.id = m.player2_id
+"""
+
+
+def sgf_escape(text):
+    return str(text).replace('\\', '\\\\').replace(']', '\\]')
+
+
+def sgf_point(x, y):
+    return string.ascii_lowercase[x] + string.ascii_lowercase[y]
+
+
+def sgf_game(game, moves, board_size=BOARD_SIZE, komi=KOMI, event=None, chunk=64):
+    """Yield one SGF game tree in pieces; moves are (x, y) or None, black first"""
+    props = [f"(;FF[4]GM[1]CA[UTF-8]AP[agladiator]SZ[{board_size}]KM[{komi}]",
+             f"GN[match {game['id']}]"]
+    if event:
+        props.append(f"EV[{sgf_escape(event)}]")
+    for prop, key in (('PB', 'black'), ('PW', 'white')):
+        if game.get(key):
+            props.append(f"{prop}[{sgf_escape(game[key])}]")
+    played = game.get('ended_at') or game.get('created_at')
+    if played:
+        props.append(f"DT[{played:%Y-%m-%d}]")
+    props.append(f"RE[{SGF_RESULTS.get(game.get('winner'), '?')}]")
+    yield ''.join(props) + '\n'
+
+    nodes = []
+    for n, move in enumerate(moves):
+        colour = 'W' if n % 2 else 'B'
+        nodes.append(f";{colour}[{sgf_point(*move) if move else ''}]")
+        if len(nodes) == chunk:
+            yield ''.join(nodes) + '\n'
+            nodes = []
+    yield ''.join(nodes) + ')\n'
+
+
+def iter_games(cursor, where='', params=(), chunk=64):
+    """Yield (game row, moves) for completed matches in match id order.
+
+    Matches are read chunk at a time by keyset on id and each chunk's moves
+    with one primary-key range query, so memory stays bounded by chunk
+    however many games match.
+    """
+    after = 0
+    while True:
+        cursor.execute(GAME_QUERY + f"""
+            WHERE m.status = 'completed' AND m.id > %s {where}
+            ORDER BY m.id LIMIT %s
+        """, (after, *params, chunk))
+        games = cursor.fetchall()
+        if not games:
+            return
+        moves = {game['id']: [] for game in games}
+        cursor.execute(f"""
+            SELECT match_id, x, y FROM moves
+            WHERE match_id IN ({', '.join(['%s'] * len(games))})
+            ORDER BY match_id, move_number
+        """, list(moves))
+        for row in cursor.fetchall():
+            moves[row['match_id']].append(
+                None if row['x'] is None else (row['x'], row['y']))
+        for game in games:
+            yield game, moves[game['id']]
+        after = games[-1]['id']
+
+
+class ArchiveWriter:
+    """Append games to a new archive; close() writes the index.
+
+    The file is built next to path and moved into place on close, so
+    readers never map a half-written archive.
+    """
+
+    def __init__(self, path, board_size=BOARD_SIZE):
+        self.path = path
+        self.board_size = board_size
+        self._tmp = path + '.tmp'
+        self._file = open(self._tmp, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION, board_size, 0, 0))
+        self._index = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self._tmp)
+
+    def __len__(self):
+        return len(self._index)
+
+    def add(self, match_id, black_id, white_id, winner, moves):
+        size = self.board_size
+        points = np.fromiter((PASS_POINT if move is None else move[1] * size + move[0]
+                              for move in moves), dtype='<u2')
+        offset = self._file.tell()
+        self._file.write(points.tobytes())
+        self._index.append((match_id, black_id or 0, white_id or 0,
+                            NO_WINNER if winner is None else winner, (0, 0, 0),
+                            len(points), offset))
+
+    def close(self):
+        f = self._file
+        f.write(b'\0' * (-f.tell() % INDEX_DTYPE.alignment))
+        index_offset = f.tell()
+        index = np.array(self._index, dtype=INDEX_DTYPE)
+        index.sort(order='match_id')
+        f.write(index.tobytes())
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, self.board_size, len(index), index_offset))
+        f.close()
+        os.replace(self._tmp, self.path)
+
+
+class GameArchive:
+    """Memory-mapped read-only view of an archive file.
+
+    Nothing is parsed up front: the index and each game's moves are numpy
+    views straight onto the mapping, and pages are read as they are touched.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.board_size, count, index_offset = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {VERSION} game archive")
+        self.index = np.frombuffer(self._map, INDEX_DTYPE, count, index_offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index['match_id'].tolist())
+
+    def __contains__(self, match_id):
+        return self._find(match_id) is not None
+
+    def _find(self, match_id):
+        i = int(np.searchsorted(self.index['match_id'], match_id))
+        if i < len(self.index) and self.index['match_id'][i] == match_id:
+            return self.index[i]
+        return None
+
+    def _entry(self, match_id):
+        entry = self._find(match_id)
+        if entry is None:
+            raise KeyError(match_id)
+        return entry
+
+    def info(self, match_id):
+        entry = self._entry(match_id)
+        winner = int(entry['winner'])
+        return {
+            'match_id': int(entry['match_id']),
+            'black_id': int(entry['black_id']) or None,
+            'white_id': int(entry['white_id']) or None,
+            'winner': None if winner == NO_WINNER else winner,
+            'moves': int(entry['moves']),
+        }
+
+    def points(self, match_id):
+        """The game's moves as a zero-copy uint16 array of points"""
+        entry = self._entry(match_id)
+        return np.frombuffer(self._map, '<u2', int(entry['moves']), int(entry['offset']))
+
+    def move(self, match_id, n):
+        """Move n (0-based) as (x, y), or None for a pass"""
+        entry = self._entry(match_id)
+        if not 0 <= n < entry['moves']:
+            raise IndexError(n)
+        point, = struct.unpack_from('<H', self._map, int(entry['offset']) + 2 * n)
+        return None if point == PASS_POINT else (point % self.board_size, point // self.board_size)
+
+    def moves(self, match_id):
+        size = self.board_size
+        return [None if point == PASS_POINT else (point % size, point // size)
+                for point in self.points(match_id).tolist()]
+
+    def position(self, match_id, n):
+        """Board array after the first n moves, captures applied"""
+        engine = GoEngine(self.board_size)
+        size = self.board_size
+        for i, point in enumerate(self.points(match_id)[:n].tolist()):
+            if point != PASS_POINT:
+                engine.play(point % size, point // size, WHITE if i % 2 else BLACK)
+        return np.asarray(engine.board)
+
+    def sgf(self, match_id, komi=KOMI):
+        info = self.info(match_id)
+        game = {'id': match_id, 'winner': info['winner']}
+        return sgf_game(game, self.moves(match_id), self.board_size, komi)
+
+    def close(self):
+        self.index = None
+        self._map.close()
+
+
+def export_archive(app, path, tournament_id=None):
+    """Write every completed match (or one tournament's) to an archive at path;
+    returns the number of games"""
+    where, params = '', ()
+    if tournament_id is not None:
+        where = "AND m.id IN (SELECT match_id FROM tournament_matches WHERE tournament_id = %s)"
+        params = (tournament_id,)
+    with app.app_context():
+        db = get_db()
+        cursor = db.cursor(dictionary=True)
+        try:
+            with ArchiveWriter(path) as writer:
+                for game, moves in iter_games(cursor, where, params):
+                    writer.add(game['id'], game['player1_id'], game['player2_id'],
+                               game['winner'], moves)
+                return len(writer)
+        finally:
+            cursor.close()
+            db.close()
+
+
+def _sgf_response(filename, chunks):
+    return Response(stream_with_context(chunks), mimetype=SGF_MIMETYPE,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+@bp_archive.route('/match/<int:match_id>.sgf')
+def match_sgf(match_id):
+    db = get_db()
+    cursor = db.cursor(dictionary=True)
+    cursor.execute(GAME_QUERY + " WHERE m.id = %s AND m.status = 'completed'", (match_id,))
+    game = cursor.fetchone()
+    if game is None:
+        cursor.close()
+        db.close()
+        return jsonify({'error': 'Unknown or unfinished match'}), 404
+
+    def chunks():
+        try:
+            cursor.execute("""
+                SELECT x, y FROM moves WHERE match_id = %s ORDER BY move_number
+            """, (match_id,))
+            yield from sgf_game(game, [None if row['x'] is None else (row['x'], row['y'])
+                                       for row in cursor.fetchall()])
+        finally:
+            cursor.close()
+            db.close()
+    return _sgf_response(f"match_{match_id}.sgf", chunks())
+
+
+@bp_archive.route('/tournament/<int:tournament_id>.sgf')
+def tournament_sgf(tournament_id):
+    """Every finished game of a tournament as one SGF collection, streamed"""
+    db = get_db()
+    cursor = db.cursor(dictionary=True)
+    cursor.execute("SELECT name FROM tournaments WHERE id = %s", (tournament_id,))
+    tournament = cursor.fetchone()
+    if tournament is None:
+        cursor.close()
+        db.close()
+        return jsonify({'error': 'Unknown tournament'}), 404
+
+    def chunks():
+        try:
+            for game, moves in iter_games(
+                    cursor,
+                    "AND m.id IN (SELECT match_id FROM tournament_matches WHERE tournament_id = %s)",
+                    (tournament_id,)):
+                yield from sgf_game(game, moves, event=tournament['name'])
+        finally:
+            cursor.close()
+            db.close()
+    return _sgf_response(f"tournament_{tournament_id}.sgf", chunks())
+
+
+def init_app(app):
+    """Register `flask export-archive`"""
+    @app.cli.command('export-archive')
+    @click.argument('path')
+    @click.option('--tournament', type=int, default=None, help='Only this tournament.')
+    def export_archive_command(path, tournament):
+        """Write finished games to a memory-mappable archive."""
+        count = export_archive(app, path, tournament)
+        click.echo(f"{count} game(s) archived to {path}")
@@ -0,0 +1,233 @@
+import threading
+import time
+
+BLACK, WHITE = 1, 2
+
+# match_id -> GameClock for every game with a running server clock
+clocks = {}
+
+_settings = {
+    'initial_seconds': 600,
+    'increment': 0,
+    'socketio': None,
+}
+
+
+class GameClock:
+    """Remaining time for both players, charged lazily at move commit.
+
+    Nothing ticks: the clock stores when the current turn started (monotonic)
+    and subtracts the elapsed time only when a move is committed or the
+    remaining time is read.
+    """
+
+    __slots__ = ('remaining', 'turn', 'turn_started', 'increment', 'flagged')
+
+    def __init__(self, initial_seconds, increment=0):
+        self.remaining = {BLACK: float(initial_seconds), WHITE: float(initial_seconds)}
+        self.turn = BLACK
+        self.turn_started = None
+        self.increment = increment
+        self.flagged = None
+
+    @property
+    def running(self):
+        return self.turn_started is not None and self.flagged is None
+
+    def start(self, now):
+        self.turn_started = now
+
+    def remaining_for(self, player, now):
+        left = self.remaining[player]
+        if self.running and player == self.turn:
+            left -= now - self.turn_started
+        return max(0.0, left)
+
+    def deadline(self):
+        return self.turn_started + self.remaining[self.turn]
+
+    def commit_move(self, next_player, now):
+        """Charge the thinking time of the player who just moved"""
+        if not self.running or next_player == self.turn:
+            return
+        mover = self.turn
+        self.remaining[mover] -= now - self.turn_started
+        self.remaining[mover] += self.increment
+        self.turn = next_player
+        self.turn_started = now
+
+    def stop(self, now):
+        if self.running:
+            self.remaining[self.turn] -= now - self.turn_started
+        self.turn_started = None
+
+    def to_payload(self, now):
+        return {
+            'turn': self.turn,
+            'black_ms': int(self.remaining_for(BLACK, now) * 1000),
+            'white_ms': int(self.remaining_for(WHITE, now) * 1000),
+            'running': self.running,
+            'flagged': self.flagged,
+        }
+
+
+class TimerWheel:
+    """Hashed timer wheel shared by every game clock.
+
+    Each key (a match id) has at most one pending deadline; rescheduling
+    replaces it and stale wheel entries are skipped when their slot comes up.
+    """
+
+    def __init__(self, tick=0.1, slots=512):
+        self.tick = tick
+        self.slots = slots
+        self._wheel = [[] for _ in range(slots)]
+        self._timers = {}
+        self._lock = threading.Lock()
+        self._origin = time.monotonic()
+        self._cursor = 0
+
+    def _tick_of(self, when):
+        return int((when - self._origin) / self.tick)
+
+    def schedule(self, key, deadline, callback):
+        with self._lock:
+            timer = (deadline, callback)
+            self._timers[key] = timer
+            due = max(self._tick_of(deadline), self._cursor)
+            self._wheel[due % self.slots].append((key, timer))
+
+    def cancel(self, key):
+        with self._lock:
+            self._timers.pop(key, None)
+
+    def __len__(self):
+        return len(self._timers)
+
+    def advance(self, now):
+        """Fire every timer whose deadline has passed"""
+        fired = []
+        with self._lock:
+            target = self._tick_of(now)
+            while self._cursor <= target:
+                slot = self._wheel[self._cursor % self.slots]
+                pending = []
+                for key, timer in slot:
+                    if self._timers.get(key) is not timer:
+                        continue
+                    if timer[0] <= now:
+                        del self._timers[key]
+                        fired.append((key, timer[1]))
+                    else:
+                        pending.append((key, timer))
+                slot[:] = pending
+                if self._cursor == target:
+                    break
+                self._cursor += 1
+        for key, callback in fired:
+            callback(key)
+        return len(fired)
+
+    def run(self, sleep):
+        while True:
+            sleep(self.tick)
+            self.advance(time.monotonic())
+
+
+timer_wheel = TimerWheel()
+
+
+def start_clock(match_id, initial_seconds=None, increment=None, now=None):
+    clock = GameClock(
+        _settings['initial_seconds'] if initial_seconds is None else initial_seconds,
+        _settings['increment'] if increment is None else increment,
+    )
+    clock.start(time.monotonic() if now is None else now)
+    clocks[match_id] = clock
+    timer_wheel.schedule(match_id, clock.deadline(), _flag_fall)
+    return clock
+
+
+def restore_clock(match_id, remaining, turn, now=None):
+    """Resume a running clock with saved remaining seconds, turn to move"""
+    clock = clocks.get(match_id)
+    if clock is None:
+        return None
+    clock.remaining.update(remaining)
+    clock.turn = turn
+    clock.start(time.monotonic() if now is None else now)
+    timer_wheel.schedule(match_id, clock.deadline(), _flag_fall)
+    return clock
+
+
+def commit_move(match_id, next_player, now=None):
+    """Switch the clock to next_player at the moment a move is committed"""
+    clock = clocks.get(match_id)
+    if clock is None or not clock.running:
+        return None
+    clock.commit_move(next_player, time.monotonic() if now is None else now)
+    timer_wheel.schedule(match_id, clock.deadline(), _flag_fall)
+    return clock
+
+
+def stop_clock(match_id):
+    clock = clocks.pop(match_id, None)
+    timer_wheel.cancel(match_id)
+    if clock is not None:
+        clock.stop(time.monotonic())
+    return clock
+
+
+def clock_payload(match_id, now=None):
+    clock = clocks.get(match_id)
+    if clock is None:
+        return None
+    return clock.to_payload(time.monotonic() if now is None else now)
+
+
+def lose_on_time(game, loser):
+    """Mark game as lost on time by loser"""
+    game.game_over = True
+    game.result_message = f"{'Black' if loser == BLACK else 'White'} lost on time"
+    game.winner = 3 - loser
+
+
+def _flag_fall(match_id):
+    clock = clocks.get(match_id)
+    if clock is None or not clock.running:
+        return
+    now = time.monotonic()
+    if clock.remaining_for(clock.turn, now) > 0:
+        # A move landed between the wheel firing and this callback
+        timer_wheel.schedule(match_id, clock.deadline(), _flag_fall)
+        return
+    clock.flagged = clock.turn
+    clock.stop(now)
+
+    # Import here to avoid circular imports
+    from .game_state import active_games
+    from .events_common import broadcast_board_update
+    from .match_runner import match_runner
+
+    socketio = _settings['socketio']
+    # A runner holds its own copy of the game and saves it after every
+    # move, so it has to end the game itself or this result is overwritten
+    if not match_runner.flag_fall(match_id, clock.flagged):
+        game = active_games.get(match_id)
+        if game is not None and not game.game_over:
+            lose_on_time(game, clock.flagged)
+            if socketio is not None:
+                broadcast_board_update(socketio, match_id, game)
+            active_games.save(match_id, game)
+    if socketio is not None:
+        socketio.emit('flag_fall', dict(clock.to_payload(now), match_id=match_id),
+                      room=f"game_{match_id}")
+
+
+def init_app(app, socketio):
+    """Read clock settings and start the shared timer wheel"""
+    _settings['initial_seconds'] = app.config.setdefault('GAME_CLOCK_SECONDS', 600)
+    _settings['increment'] = app.config.setdefault('GAME_CLOCK_INCREMENT', 0)
+    _settings['socketio'] = socketio
+    timer_wheel.tick = app.config.setdefault('GAME_CLOCK_WHEEL_TICK', 0.1)
+    socketio.start_background_task(timer_wheel.run, socketio.sleep)
@@ -1,15 +1,11 @@
 from flask_socketio import emit, join_room, leave_room
-from flask import session
-import mysql.connector
-
-def get_db():
-    """Get database connection"""
-    return mysql.connector.connect(
-        host='localhost',
-        user='root',
-        password='',
-        database='register'
-    )
+from flask import request, session
+from .events_common import board_snapshot
+from .game_clock import clock_payload
+from .match_runner import is_player, match_runner, SPECTATOR
+from .metrics import log_event
+from .replay import history_page, seek_position
+from .spectator import spectator_channel, spectator_room, ticker_room
 
 def initialize_socketio(socketio):
     """Initialize Socket.IO event handlers"""
@@ -35,7 +31,7 @@ def initialize_socketio(socketio):
         room_name = f"game_{match_id}"
         join_room(room_name)
         
-        print(f"Player {username} joined game room {room_name}")
+        log_event("join_game", username=username, room=room_name)
         
         # Notify other players in the room
         emit('player_joined', {
@@ -68,73 +64,126 @@ def initialize_socketio(socketio):
     @socketio.on('request_board_state')
     def handle_board_state_request(data):
         """Send current board state to requesting player"""
-        match_id = data['match_id']
+        match_id = int(data['match_id'])
         room_name = f"game_{match_id}"
         
         # Import here to avoid circular imports
-        from .game_controller import active_games
+        from .game_state import active_games
         
-        if match_id in active_games:
-            game = active_games[match_id]
-            board_data = {
-                'board': game.board.tolist(),
-                'current_player': game.current_player,
-                'move_history': game.move_history,
-                'game_over': game.game_over,
-                'result_message': game.result_message
-            }
-            emit('board_update', board_data)
+        game = active_games.get(match_id)
+        if game:
+            emit('board_update', board_snapshot(match_id, game))
         else:
             emit('error', {'message': 'Game not found'})
 
+    @socketio.on('request_move_history')
+    def handle_move_history_request(data):
+        """Page through move_history; start is 0-based, count capped at MOVE_HISTORY_PAGE_SIZE"""
+        match_id = int(data['match_id'])
+
+        # Import here to avoid circular imports
+        from .game_state import active_games
+
+        game = active_games.get(match_id)
+        if game is None:
+            emit('error', {'message': 'Game not found'})
+            return
+        page = history_page(game, int(data.get('start', 0)), int(data.get('count', 0)))
+        emit('move_history_page', dict(page, match_id=match_id))
+
+    @socketio.on('seek')
+    def handle_seek(data):
+        """Position after move_number moves, for scrubbing through a game"""
+        match_id = int(data['match_id'])
+        try:
+            move_number = int(data['move_number'])
+        except (KeyError, TypeError, ValueError):
+            emit('error', {'message': 'Invalid move number'})
+            return
+
+        # Import here to avoid circular imports
+        from .game_state import active_games
+
+        game = active_games.get(match_id)
+        if game is None:
+            emit('error', {'message': 'Game not found'})
+            return
+        if not 0 <= move_number <= len(game.move_history):
+            emit('error', {'message': 'Move number out of range'})
+            return
+        emit('seek_position', seek_position(match_id, game, move_number))
+
     @socketio.on('updateClock')
     def handle_clock(data):
-        match_id = data['match_id']
-        player = data['player']
-        minutes = data['minutes']
-        seconds = data['seconds']
+        """Reply with the server clock; browsers no longer report their own time"""
+        match_id = int(data['match_id'])
+        clock = clock_payload(match_id)
+        if clock:
+            emit('clock_update', dict(clock, match_id=match_id))
+        else:
+            emit('error', {'message': 'Clock not found'})
+
+    @socketio.on('run_match')
+    def handle_run_match(data):
+        """Ask the server to play a game out at spectator pace; players only"""
+        match_id = int(data['match_id'])
+        user_id = session.get('user_id')
+
+        if not user_id:
+            emit('error', {'message': 'Not authenticated'})
+            return
+        if not is_player(match_id, user_id):
+            emit('error', {'message': 'Not a player in this match'})
+            return
 
         # Import here to avoid circular imports
-        from .game_controller import active_games
-        
-        # Update match state
+        from .game_state import active_games
+
+        if match_id not in active_games:
+            emit('error', {'message': 'Game not found'})
+            return
+        started = match_runner.start(match_id, SPECTATOR)
+        emit('match_running', {'match_id': match_id, 'started': started})
+
+    @socketio.on('spectate')
+    def handle_spectate(data):
+        """Watch a game through the rate-capped spectator channel"""
+        match_id = int(data['match_id'])
+
+        # Import here to avoid circular imports
+        from .game_state import active_games
+
         game = active_games.get(match_id)
-        if game:
-            if player == 1:
-                game.player1_time = (minutes, seconds)
-            else:
-                game.player2_time = (minutes, seconds)
-            
-            # Broadcast to all players
-            emit('clock_update', {
-                'player': player,
-                'minutes': minutes,
-                'seconds': seconds
-            }, room=f"game_{match_id}")
+        if game is None:
+            emit('error', {'message': 'Game not found'})
+            return
+        join_room(spectator_room(match_id))
+        spectator_channel.watch(match_id, request.sid)
+        emit('spectator_snapshot', spectator_channel.snapshot(match_id, game))
+
+    @socketio.on('stop_spectating')
+    def handle_stop_spectating(data):
+        match_id = int(data['match_id'])
+        leave_room(spectator_room(match_id))
+        spectator_channel.unwatch(match_id, request.sid)
+
+    @socketio.on('watch_tournament')
+    def handle_watch_tournament(data):
+        """Follow every running game of a tournament on its live ticker"""
+        join_room(ticker_room(int(data['tournament_id'])))
+
+    @socketio.on('unwatch_tournament')
+    def handle_unwatch_tournament(data):
+        leave_room(ticker_room(int(data['tournament_id'])))
 
     @socketio.on('disconnect')
     def handle_disconnect():
         """Handle client disconnect"""
+        spectator_channel.leave(request.sid)
         username = session.get('username', 'Unknown')
-        print(f'Client {username} disconnected')
+        log_event("disconnect", username=username)
 
 def broadcast_match_ready(socketio, match_id):
     socketio.emit('match_ready', 
                  {'match_id': match_id},
                  room=f"user_{session['user_id']}")
-
-def broadcast_board_update(socketio, match_id, game):
-    """Broadcast board update to all players in the game"""
-    room_name = f"game_{match_id}"
-    
-    board_data = {
-        'board': game.board.tolist(),
-        'current_player': game.current_player,
-        'move_history': game.move_history[-1] if game.move_history else None,
-        'game_over': game.game_over,
-        'result_message': game.result_message,
-        'last_move': game.move_history[-1] if game.move_history else None
-    }
-    
-    socketio.emit('board_update', board_data, room=f"game_{match_id}")
-    print(f"Broadcasting board update to room {room_name}")
@@ -1 +1,175 @@
-active_games = {}
\ No newline at end of file
+import os
+import pickle
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+
+import numpy as np
+
+from .game_clock import start_clock
+from .packed_board import PackedBoard
+
+
+class InProcessBackend:
+    """Live games kept in this process's memory (single server process)"""
+
+    def __init__(self):
+        self._games = {}
+
+    def get(self, match_id):
+        return self._games.get(match_id)
+
+    def put(self, match_id, game):
+        self._games[match_id] = game
+
+    def save(self, match_id, game):
+        # Games are mutated in place, nothing to write back
+        pass
+
+    def delete(self, match_id):
+        del self._games[match_id]
+
+    def contains(self, match_id):
+        return match_id in self._games
+
+    def count(self):
+        return len(self._games)
+
+    def keys(self):
+        return list(self._games)
+
+
+class SQLiteBackend:
+    """Live games pickled into one SQLite file shared by every worker process
+    on the host, so any process can serve any game room"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS active_games (
+                match_id INTEGER PRIMARY KEY,
+                game BLOB NOT NULL
+            )
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _dumps(game):
+        """Pickle with the board packed; the game keeps its NumPy board"""
+        board = game.board
+        game.board = PackedBoard.from_array(board)
+        try:
+            return pickle.dumps((np.asarray(board).dtype.str, game), pickle.HIGHEST_PROTOCOL)
+        finally:
+            game.board = board
+
+    @staticmethod
+    def _loads(data):
+        dtype, game = pickle.loads(data)
+        game.board = np.array(game.board, dtype=dtype)
+        return game
+
+    def get(self, match_id):
+        row = self._conn().execute(
+            "SELECT game FROM active_games WHERE match_id = ?", (match_id,)).fetchone()
+        return self._loads(row[0]) if row else None
+
+    def put(self, match_id, game):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO active_games (match_id, game) VALUES (?, ?)",
+            (match_id, self._dumps(game)))
+
+    save = put
+
+    def delete(self, match_id):
+        cur = self._conn().execute("DELETE FROM active_games WHERE match_id = ?", (match_id,))
+        if not cur.rowcount:
+            raise KeyError(match_id)
+
+    def contains(self, match_id):
+        return self._conn().execute(
+            "SELECT EXISTS (SELECT 1 FROM active_games WHERE match_id = ?)",
+            (match_id,)).fetchone()[0] == 1
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM active_games").fetchone()[0]
+
+    def keys(self):
+        return [row[0] for row in self._conn().execute("SELECT match_id FROM active_games")]
+
+
+class GameStore(MutableMapping):
+    """Dict-like view of live games over a pluggable backend.
+
+    Code that changes a game must call save() afterwards so processes using
+    a shared backend see the change; for the in-process backend it is free.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or InProcessBackend()
+
+    def __getitem__(self, match_id):
+        game = self.backend.get(match_id)
+        if game is None:
+            raise KeyError(match_id)
+        return game
+
+    def __setitem__(self, match_id, game):
+        self.backend.put(match_id, game)
+
+    def __delitem__(self, match_id):
+        self.backend.delete(match_id)
+
+    def __iter__(self):
+        return iter(self.backend.keys())
+
+    def __len__(self):
+        return self.backend.count()
+
+    def __contains__(self, match_id):
+        return self.backend.contains(match_id)
+
+    def get(self, match_id, default=None):
+        game = self.backend.get(match_id)
+        return default if game is None else game
+
+    def save(self, match_id, game):
+        self.backend.save(match_id, game)
+
+
+active_games = GameStore()
+
+
+def init_app(app):
+    """Pick the game-state backend: GAME_STATE_BACKEND = 'memory' or 'sqlite'"""
+    kind = app.config.setdefault('GAME_STATE_BACKEND', 'memory')
+    if kind == 'sqlite':
+        path = app.config.setdefault(
+            'GAME_STATE_PATH', os.path.join(app.instance_path, 'active_games.sqlite'))
+        active_games.backend = SQLiteBackend(path)
+    elif kind == 'memory':
+        active_games.backend = InProcessBackend()
+    else:
+        raise ValueError(f"Unknown GAME_STATE_BACKEND {kind!r}")
+
+
+def add_game(match_id, game, run_mode='rated'):
+    """Store a live game and start its server-side clock. The game keeps its
+    NumPy board; shared backends pack it only when storing. Unless run_mode
+    is None the match runner then plays it out without waiting for a browser."""
+    active_games[match_id] = game
+    start_clock(match_id)
+    if run_mode:
+        # Import here to avoid circular imports
+        from .match_runner import match_runner
+        match_runner.start(match_id, run_mode)
+    return game
@@ -0,0 +1,196 @@
+import bisect
+import threading
+
+from flask import Blueprint, current_app, jsonify, request
+
+from .db_pool import get_db
+from .metrics import log_error
+
+bp_leaderboard = Blueprint('leaderboard', __name__, url_prefix='/leaderboard')
+
+
+class Leaderboard:
+    """Order-statistic index over users.elo.
+
+    A Fenwick tree counts players per rating, with rating max_elo at slot 1
+    so prefix sums count everyone rated at or above a value. Each rating
+    keeps its players sorted by user id, which is how ties are ranked.
+    Rank lookups and the k-th player are both O(log max_elo).
+    """
+
+    def __init__(self, max_elo=8191):
+        self.max_elo = max_elo
+        self._tree = [0] * (max_elo + 2)
+        self._buckets = {}
+        self._players = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._players)
+
+    def __contains__(self, user_id):
+        return user_id in self._players
+
+    def _slot(self, elo):
+        return self.max_elo - min(max(int(elo), 0), self.max_elo) + 1
+
+    def _add(self, slot, delta):
+        while slot < len(self._tree):
+            self._tree[slot] += delta
+            slot += slot & -slot
+
+    def _prefix(self, slot):
+        """Players in slots 1..slot, i.e. rated at or above that slot's elo"""
+        total = 0
+        while slot > 0:
+            total += self._tree[slot]
+            slot -= slot & -slot
+        return total
+
+    def _find(self, k):
+        """Slot holding the k-th (0-based) player from the top"""
+        slot, step = 0, 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = slot + step
+            if nxt < len(self._tree) and self._tree[nxt] <= k:
+                slot = nxt
+                k -= self._tree[nxt]
+            step >>= 1
+        return slot + 1, k
+
+    def _insert(self, user_id, elo, username):
+        slot = self._slot(elo)
+        bisect.insort(self._buckets.setdefault(slot, []), user_id)
+        self._players[user_id] = (elo, username)
+        self._add(slot, 1)
+
+    def _delete(self, user_id):
+        elo, username = self._players.pop(user_id)
+        slot = self._slot(elo)
+        bucket = self._buckets[slot]
+        del bucket[bisect.bisect_left(bucket, user_id)]
+        if not bucket:
+            del self._buckets[slot]
+        self._add(slot, -1)
+        return elo, username
+
+    def update(self, user_id, elo, username=None):
+        """Insert a player or move them to a new rating"""
+        with self._lock:
+            if user_id in self._players:
+                _, known = self._delete(user_id)
+                username = username or known
+            self._insert(user_id, elo, username)
+
+    def adjust(self, user_id, delta):
+        """Apply a rating change to a player already on the board"""
+        with self._lock:
+            if user_id in self._players:
+                elo, username = self._delete(user_id)
+                self._insert(user_id, elo + delta, username)
+
+    def remove(self, user_id):
+        with self._lock:
+            if user_id in self._players:
+                self._delete(user_id)
+
+    def load(self, rows):
+        """Replace the whole board with (user_id, username, elo) rows"""
+        with self._lock:
+            self._tree = [0] * (self.max_elo + 2)
+            self._buckets = {}
+            self._players = {}
+            for user_id, username, elo in rows:
+                self._insert(user_id, elo, username)
+
+    def rank(self, user_id):
+        """1-based rank, or None for unknown players"""
+        with self._lock:
+            if user_id not in self._players:
+                return None
+            slot = self._slot(self._players[user_id][0])
+            return self._prefix(slot - 1) + bisect.bisect_left(self._buckets[slot], user_id) + 1
+
+    def _entry(self, rank, user_id):
+        elo, username = self._players[user_id]
+        return {'rank': rank, 'user_id': user_id, 'username': username, 'elo': elo}
+
+    def page(self, start, count):
+        """Up to count players starting at 0-based position start"""
+        with self._lock:
+            entries = []
+            position = start
+            while len(entries) < count and position < len(self._players):
+                slot, offset = self._find(position)
+                for user_id in self._buckets[slot][offset:offset + count - len(entries)]:
+                    position += 1
+                    entries.append(self._entry(position, user_id))
+            return entries
+
+    def top(self, n=10):
+        return self.page(0, n)
+
+    def around(self, user_id, radius=5):
+        """The player plus up to radius players either side of them"""
+        with self._lock:
+            rank = self.rank(user_id)
+            if rank is None:
+                return []
+            start = max(rank - 1 - radius, 0)
+            return self.page(start, rank - start + radius)
+
+
+leaderboard = Leaderboard()
+
+
+def rebuild(app, batch=5000):
+    """Reload the board from users in one streamed query"""
+    with app.app_context():
+        db = get_db()
+        cursor = db.cursor()
+        try:
+            cursor.execute("SELECT id, username, elo FROM users")
+
+            def rows():
+                while True:
+                    chunk = cursor.fetchmany(batch)
+                    if not chunk:
+                        return
+                    yield from chunk
+            leaderboard.load(rows())
+        finally:
+            cursor.close()
+            db.close()
+
+
+@bp_leaderboard.route('/')
+def top_players():
+    start = max(request.args.get('start', 0, type=int), 0)
+    count = max(1, min(request.args.get('count', 50, type=int),
+                       current_app.config.get('LEADERBOARD_PAGE_SIZE', 100)))
+    return jsonify({'total': len(leaderboard), 'players': leaderboard.page(start, count)})
+
+
+@bp_leaderboard.route('/user/<int:user_id>')
+def player_rank(user_id):
+    radius = max(0, min(request.args.get('radius', 5, type=int), 50))
+    rank = leaderboard.rank(user_id)
+    if rank is None:
+        return jsonify({'error': 'Unknown user'}), 404
+    return jsonify({
+        'user_id': user_id,
+        'rank': rank,
+        'total': len(leaderboard),
+        'neighbours': leaderboard.around(user_id, radius),
+    })
+
+
+def init_app(app):
+    """Build the leaderboard from MySQL (LEADERBOARD_MAX_ELO, LEADERBOARD_PAGE_SIZE)"""
+    app.config.setdefault('LEADERBOARD_PAGE_SIZE', 100)
+    leaderboard.max_elo = app.config.setdefault('LEADERBOARD_MAX_ELO', 8191)
+    leaderboard.load(())
+    try:
+        rebuild(app)
+    except Exception as e:
+        log_error("leaderboard_load_failed", e)
@@ -0,0 +1,166 @@
+import threading
+import time
+from collections import deque
+
+from .db_pool import get_db
+from .events_common import broadcast_board_update
+from .game_clock import lose_on_time
+from .metrics import log_error
+
+RATED, SPECTATOR = 'rated', 'spectator'
+
+
+def default_step(game):
+    """Advance one move, the same call the /game/next_move endpoint makes"""
+    return game.next_move()
+
+
+class MatchRunner:
+    """Drives live games in game_state.active_games to completion on the server.
+
+    Rated games run at full speed (the loop only yields between moves);
+    spectator games wait RUNNER_SPECTATOR_DELAY seconds between moves so
+    people can follow them. Every move is streamed to the game_{match_id} room.
+    """
+
+    def __init__(self, step=default_step, spectator_delay=1.2, window=60.0):
+        self.step = step
+        self.spectator_delay = spectator_delay
+        self.window = window
+        self.app = None
+        self.socketio = None
+        self.finish_listeners = []
+        self._running = {}
+        self._flagged = {}
+        self._finished_at = deque()
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self.counters = {'games_started': 0, 'games_finished': 0, 'games_failed': 0, 'moves': 0}
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.spectator_delay = app.config.setdefault('RUNNER_SPECTATOR_DELAY', 1.2)
+
+    def add_finish_listener(self, listener):
+        """listener(match_id, game) is called after a game ends"""
+        self.finish_listeners.append(listener)
+
+    def is_running(self, match_id):
+        return match_id in self._running
+
+    def start(self, match_id, mode=RATED):
+        """Start driving a game, or switch a running game to mode's pace.
+
+        Returns False if it is already being played in that mode.
+        """
+        with self._lock:
+            if match_id in self._running:
+                if self._running[match_id] == mode:
+                    return False
+                # The loop reads the mode before every move
+                self._running[match_id] = mode
+                return True
+            self._running[match_id] = mode
+            self.counters['games_started'] += 1
+        self.socketio.start_background_task(self._play, match_id)
+        return True
+
+    def flag_fall(self, match_id, loser):
+        """Hand a flag-fall to the loop driving the game; False if none is"""
+        with self._lock:
+            if match_id not in self._running:
+                return False
+            self._flagged[match_id] = loser
+            return True
+
+    def _play(self, match_id):
+        # Import here to avoid circular imports
+        from .game_state import active_games
+
+        moves = 0
+        try:
+            game = active_games[match_id]
+            while not game.game_over:
+                with self._lock:
+                    loser = self._flagged.pop(match_id, None)
+                if loser is not None:
+                    lose_on_time(game, loser)
+                else:
+                    self.step(game)
+                    moves += 1
+                broadcast_board_update(self.socketio, match_id, game)
+                active_games.save(match_id, game)
+                delay = self.spectator_delay if self._running.get(match_id) == SPECTATOR else 0
+                self.socketio.sleep(delay)
+        except Exception as e:
+            log_error("match_runner_failed", e, match_id=match_id)
+            with self._lock:
+                self.counters['games_failed'] += 1
+            return
+        finally:
+            with self._lock:
+                self._running.pop(match_id, None)
+                self._flagged.pop(match_id, None)
+                self.counters['moves'] += moves
+
+        self._record_result(match_id, game)
+        with self._lock:
+            self.counters['games_finished'] += 1
+            self._finished_at.append(time.monotonic())
+        for listener in self.finish_listeners:
+            listener(match_id, game)
+
+    def _record_result(self, match_id, game):
+        # Import here to avoid circular imports
+        from .game_state import active_games
+
+        # Finished games leave the live store; listeners still get the object
+        active_games.pop(match_id, None)
+        with self.app.app_context():
+            db = get_db()
+            cursor = db.cursor()
+            try:
+                cursor.execute("""
+                    UPDATE matches SET status = 'completed', winner = %s, ended_at = NOW()
+                    WHERE id = %s
+                """, (getattr(game, 'winner', None), match_id))
+                db.commit()
+            finally:
+                cursor.close()
+                db.close()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._finished_at and now - self._finished_at[0] > self.window:
+                self._finished_at.popleft()
+            stats = dict(self.counters)
+            stats['running'] = len(self._running)
+            recent = len(self._finished_at)
+        uptime = max(now - self._started_at, 1e-9)
+        stats['games_per_sec'] = recent / min(self.window, uptime)
+        stats['games_per_sec_total'] = stats['games_finished'] / uptime
+        stats['moves_per_sec_total'] = stats['moves'] / uptime
+        return stats
+
+
+match_runner = MatchRunner()
+
+
+def is_player(match_id, user_id):
+    """Whether user_id plays in match_id"""
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        cursor.execute("""
+            SELECT 1 FROM matches WHERE id = %s AND %s IN (player1_id, player2_id)
+        """, (match_id, user_id))
+        return cursor.fetchone() is not None
+    finally:
+        cursor.close()
+        db.close()
+
+
+def init_app(app, socketio):
+    match_runner.init_app(app, socketio)
@@ -0,0 +1,233 @@
+import itertools
+import threading
+import time
+from collections import namedtuple
+
+from .db_pool import get_db
+from .metrics import log_error
+
+# Ordered by (elo, seq); seq is unique so the remaining fields never compare
+QueueEntry = namedtuple('QueueEntry', 'elo seq user_id username enqueued_at')
+
+
+class MatchmakingQueue:
+    """Waiting players kept in an Elo-sorted index so pairing never scans MySQL.
+
+    As on the leaderboard, a Fenwick tree counts waiting players per rating
+    and each rating keeps its players in queue order, so enqueue, dequeue
+    and finding the nearest occupied rating either side are O(log max_elo).
+    """
+
+    def __init__(self, base_window=200, widen_per_second=5, max_window=600, max_elo=8191):
+        self.base_window = base_window
+        self.widen_per_second = widen_per_second
+        self.max_window = max_window
+        self.max_elo = max_elo
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._tree = [0] * (self.max_elo + 2)
+            self._buckets = {}
+            self._entries = {}
+
+    def __contains__(self, user_id):
+        return user_id in self._entries
+
+    def window(self, entry, now):
+        """Accepted Elo distance, widening the longer the player has waited"""
+        waited = max(0.0, now - entry.enqueued_at)
+        return min(self.max_window, self.base_window + self.widen_per_second * waited)
+
+    def _slot(self, elo):
+        return min(max(int(elo), 0), self.max_elo) + 1
+
+    def _add(self, slot, delta):
+        while slot < len(self._tree):
+            self._tree[slot] += delta
+            slot += slot & -slot
+
+    def _prefix(self, slot):
+        """Players waiting in slots 1..slot, i.e. rated at or below that slot's elo"""
+        total = 0
+        while slot > 0:
+            total += self._tree[slot]
+            slot -= slot & -slot
+        return total
+
+    def _find(self, k):
+        """Slot holding the k-th (0-based) lowest-rated waiting player"""
+        slot, step = 0, 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = slot + step
+            if nxt < len(self._tree) and self._tree[nxt] <= k:
+                slot = nxt
+                k -= self._tree[nxt]
+            step >>= 1
+        return slot + 1
+
+    def _below(self, slot):
+        """Nearest occupied slot under slot, or None"""
+        k = self._prefix(slot - 1)
+        return self._find(k - 1) if k else None
+
+    def _above(self, slot):
+        """Nearest occupied slot over slot, or None"""
+        k = self._prefix(slot)
+        return self._find(k) if k < len(self._entries) else None
+
+    def _insert(self, entry):
+        slot = self._slot(entry.elo)
+        bucket = self._buckets.setdefault(slot, {})
+        requeued = bucket and entry.seq < next(reversed(bucket.values())).seq
+        bucket[entry.user_id] = entry
+        if requeued:
+            # A requeued entry goes back to its place in queue order
+            self._buckets[slot] = dict(sorted(bucket.items(), key=lambda item: item[1].seq))
+        self._entries[entry.user_id] = entry
+        self._add(slot, 1)
+
+    def _remove(self, entry):
+        slot = self._slot(entry.elo)
+        bucket = self._buckets[slot]
+        del bucket[entry.user_id]
+        if not bucket:
+            del self._buckets[slot]
+        del self._entries[entry.user_id]
+        self._add(slot, -1)
+
+    def _closest(self, elo, window, now):
+        """Nearest waiting player either side of elo that either side accepts.
+
+        The joining player accepts anyone within window; a waiting player
+        also accepts anyone within their own, widened, window. Within one
+        rating the longest-waiting player has the widest window, so only
+        the first of each rating needs checking.
+        """
+        target = self._slot(elo)
+        left, right = self._below(target), self._above(target - 1)
+        while left is not None or right is not None:
+            left_gap = target - left if left is not None else None
+            right_gap = right - target if right is not None else None
+            if right_gap is None or (left_gap is not None and left_gap <= right_gap):
+                slot, gap = left, left_gap
+                left = self._below(left)
+            else:
+                slot, gap = right, right_gap
+                right = self._above(right)
+            if gap > self.max_window:
+                return None
+            candidate = next(iter(self._buckets[slot].values()))
+            if abs(candidate.elo - elo) <= max(window, self.window(candidate, now)):
+                return candidate
+        return None
+
+    def enqueue(self, user_id, elo, username=None, now=None):
+        """Pair the player with the closest acceptable opponent or queue them.
+
+        Returns the opponent's QueueEntry (already removed from the queue), or
+        None if the player is now waiting.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if user_id in self._entries:
+                return None
+            opponent = self._closest(elo, self.base_window, now)
+            if opponent is not None:
+                self._remove(opponent)
+                return opponent
+            self._insert(QueueEntry(elo, next(self._seq), user_id, username, now))
+            return None
+
+    def requeue(self, entry):
+        """Put a popped entry back, keeping its original wait time"""
+        with self._lock:
+            if entry.user_id not in self._entries:
+                self._insert(entry)
+
+    def dequeue(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._remove(entry)
+            return entry
+
+    def sweep(self, now=None):
+        """Pair Elo-neighbours once either one's widened window covers the gap"""
+        now = time.monotonic() if now is None else now
+        pairs = []
+        with self._lock:
+            ordered = [entry for slot in sorted(self._buckets)
+                       for entry in self._buckets[slot].values()]
+            i = 0
+            while i + 1 < len(ordered):
+                first, second = ordered[i], ordered[i + 1]
+                gap = second.elo - first.elo
+                if gap <= max(self.window(first, now), self.window(second, now)):
+                    self._remove(second)
+                    self._remove(first)
+                    pairs.append((first, second) if first.seq < second.seq else (second, first))
+                    i += 2
+                else:
+                    i += 1
+        return pairs
+
+
+matchmaking_queue = MatchmakingQueue()
+
+
+def record_pairing(cursor, waiting, joining_user_id):
+    """Write the final pairing as an active match and return its id"""
+    cursor.execute("""
+        INSERT INTO matches (player1_id, player2_id, status)
+        VALUES (%s, %s, 'active')
+    """, (waiting.user_id, joining_user_id))
+    return cursor.lastrowid
+
+
+def broadcast_match_ready(socketio, match_id, *user_ids):
+    for user_id in user_ids:
+        socketio.emit('match_ready', {'match_id': match_id}, room=f"user_{user_id}")
+
+
+def _sweep_loop(app, socketio, interval):
+    while True:
+        socketio.sleep(interval)
+        pairs = matchmaking_queue.sweep()
+        if not pairs:
+            continue
+        with app.app_context():
+            db = get_db()
+            cursor = db.cursor()
+            recorded = 0
+            try:
+                for waiting, joining in pairs:
+                    match_id = record_pairing(cursor, waiting, joining.user_id)
+                    db.commit()
+                    recorded += 1
+                    broadcast_match_ready(socketio, match_id, waiting.user_id, joining.user_id)
+            except Exception as e:
+                log_error("matchmaking_sweep_failed", e)
+                db.rollback()
+                for waiting, joining in pairs[recorded:]:
+                    matchmaking_queue.requeue(waiting)
+                    matchmaking_queue.requeue(joining)
+            finally:
+                cursor.close()
+                db.close()
+
+
+def init_app(app, socketio):
+    """Configure the shared queue and start the background widening sweep"""
+    matchmaking_queue.base_window = app.config.setdefault('MATCHMAKING_ELO_WINDOW', 200)
+    matchmaking_queue.widen_per_second = app.config.setdefault('MATCHMAKING_WIDEN_PER_SECOND', 5)
+    matchmaking_queue.max_window = app.config.setdefault('MATCHMAKING_MAX_WINDOW', 600)
+    matchmaking_queue.max_elo = app.config.setdefault('LEADERBOARD_MAX_ELO', 8191)
+    matchmaking_queue.clear()
+    interval = app.config.setdefault('MATCHMAKING_SWEEP_INTERVAL', 1.0)
+    socketio.start_background_task(_sweep_loop, app, socketio, interval)
@@ -0,0 +1,349 @@
+"""Prometheus-format metrics and sampled structured logging.
+
+Everything is kept in process and rendered on demand at /metrics, so
+recording a sample is a dict lookup and a few additions under a lock.
+"""
+import bisect
+import inspect
+import json
+import logging
+import random
+import re
+import threading
+import time
+from functools import lru_cache, wraps
+
+from flask import Blueprint, Response, g, request
+
+bp_metrics = Blueprint('metrics', __name__)
+
+logger = logging.getLogger('agladiator')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_settings = {'log_sample_rate': 0.01}
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), then sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket"
+                             f"{_format_labels(self.labels, key, [('le', bound)])} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {values[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Gauge:
+    """Read from a callback at scrape time, so the hot path never updates it"""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help = help_text
+        self.read = read
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}",
+                f"{self.name} {value}"]
+
+
+class ReadCounter(Gauge):
+    """A running total kept by another component, read at scrape time"""
+    kind = 'counter'
+
+
+HTTP_SECONDS = Histogram('agl_http_request_duration_seconds', 'HTTP request latency by route',
+                         ('endpoint', 'method', 'status'))
+EVENT_SECONDS = Histogram('agl_socketio_event_duration_seconds', 'Socket.IO handler latency by event',
+                          ('event',))
+DB_SECONDS = Histogram('agl_db_query_duration_seconds', 'MySQL statement latency by statement',
+                       ('statement',))
+AGENT_MOVE_SECONDS = Histogram('agl_agent_move_duration_seconds',
+                               'Agent move latency; cold includes starting the worker',
+                               ('start',))
+EMITS = Counter('agl_socketio_emits_total', 'Socket.IO emits by event and room kind',
+                ('event', 'room'))
+EMIT_BYTES = Counter('agl_socketio_emit_bytes_total',
+                     'Serialized Socket.IO payload bytes by room kind; dict payloads are sampled',
+                     ('room',))
+
+
+def _active_games():
+    # Import here to avoid circular imports
+    from .game_state import active_games
+    return len(active_games)
+
+
+def _queue_depth():
+    # Import here to avoid circular imports
+    from .matchmaking import matchmaking_queue
+    return len(matchmaking_queue)
+
+
+def _runner_stat(key):
+    def read():
+        # Import here to avoid circular imports
+        from .match_runner import match_runner
+        return match_runner.stats()[key]
+    return read
+
+
+def _agent_pool_stat(key):
+    def read():
+        # Import here to avoid circular imports
+        from .agent_pool import agent_pool
+        return agent_pool.stats()[key]
+    return read
+
+
+def _pool_stat(key):
+    def read():
+        # Import here to avoid circular imports
+        from .db_pool import get_pool
+        return get_pool().snapshot()[key]
+    return read
+
+
+METRICS = [
+    HTTP_SECONDS, EVENT_SECONDS, DB_SECONDS, AGENT_MOVE_SECONDS, EMITS, EMIT_BYTES,
+    Gauge('agl_active_games', 'Games in game_state.active_games', _active_games),
+    Gauge('agl_matchmaking_queue_depth', 'Players waiting in the matchmaking queue', _queue_depth),
+    Gauge('agl_match_runner_games_per_second', 'Games the match runner finished per second '
+          'over the last minute', _runner_stat('games_per_sec')),
+    Gauge('agl_match_runner_running_games', 'Games the match runner is driving', _runner_stat('running')),
+    ReadCounter('agl_match_runner_games_finished_total', 'Games the match runner played to the end',
+                _runner_stat('games_finished')),
+    ReadCounter('agl_match_runner_games_failed_total', 'Games the match runner stopped on an error',
+                _runner_stat('games_failed')),
+    ReadCounter('agl_match_runner_moves_total', 'Moves played by the match runner', _runner_stat('moves')),
+    Gauge('agl_agent_pool_processes', 'Warm agent worker processes', _agent_pool_stat('processes')),
+    Gauge('agl_agent_pool_busy', 'Agent workers answering a move', _agent_pool_stat('busy')),
+    ReadCounter('agl_db_pool_checkouts_total', 'Connections lent out by the MySQL pool',
+                _pool_stat('checkouts')),
+    ReadCounter('agl_db_pool_waits_total', 'Checkouts that found every connection in use',
+                _pool_stat('waits')),
+    ReadCounter('agl_db_pool_exhausted_total', 'Checkouts that gave up after DB_POOL_TIMEOUT',
+                _pool_stat('exhausted')),
+    ReadCounter('agl_db_pool_connections_created_total', 'MySQL connections opened by the pool',
+                _pool_stat('created')),
+    ReadCounter('agl_db_pool_connections_discarded_total', 'Stale or broken pool connections dropped',
+                _pool_stat('discarded')),
+    Gauge('agl_db_pool_in_use', 'Pool connections currently lent out', _pool_stat('in_use')),
+    Gauge('agl_db_pool_idle', 'Pool connections open and free', _pool_stat('idle')),
+]
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+_ROOM_KIND = re.compile(r'([a-z]+)_\d+$')
+
+
+@lru_cache(maxsize=1024)
+def statement_label(sql):
+    """'SELECT users', 'UPDATE matches', ... - one label per statement shape"""
+    words = sql.split(None, 1)
+    if not words:
+        return 'EMPTY'
+    verb = words[0].upper()
+    table = re.search(r'\b(?:FROM|INTO|UPDATE|TABLE|JOIN)\s+`?(\w+)', sql, re.IGNORECASE)
+    return f"{verb} {table.group(1)}" if table else verb
+
+
+def room_kind(room):
+    """game_12 -> game; keeps label cardinality bounded however many rooms exist"""
+    if room is None:
+        return 'broadcast'
+    match = _ROOM_KIND.match(str(room))
+    # Anything else is a reply to a single socket's sid
+    return match.group(1) if match else 'sid'
+
+
+class TimedCursor:
+    """Cursor proxy that records execute() latency in DB_SECONDS"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - start, statement=statement_label(operation))
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """Structured log line; INFO and below are sampled at METRICS_LOG_SAMPLE_RATE"""
+    if level <= logging.INFO and random.random() >= _settings['log_sample_rate']:
+        return
+    if not logger.isEnabledFor(level):
+        return
+    fields['event'] = event
+    fields['ts'] = round(time.time(), 3)
+    logger.log(level, json.dumps(fields, default=str))
+
+
+def log_error(event, error, **fields):
+    log_event(event, logging.ERROR, error=str(error), **fields)
+
+
+@bp_metrics.route('/metrics')
+def metrics_endpoint():
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+def _instrument_socketio(socketio):
+    """Time every handler registered through socketio.on and count every emit"""
+    register = socketio.on
+    emit = socketio.emit
+
+    def on(message, namespace=None):
+        decorator = register(message, namespace)
+
+        def timed_decorator(handler):
+            # Flask-SocketIO retries connect handlers without the auth
+            # argument on TypeError; pass only what the handler takes
+            parameters = inspect.signature(handler).parameters.values()
+            accepted = (None if any(p.kind == p.VAR_POSITIONAL for p in parameters)
+                        else len(parameters))
+
+            @wraps(handler)
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return handler(*args[:accepted], **kwargs)
+                finally:
+                    EVENT_SECONDS.observe(time.perf_counter() - start, event=message)
+            decorator(timed)
+            return handler
+        return timed_decorator
+
+    def counted_emit(event, *args, **kwargs):
+        room = room_kind(kwargs.get('to', kwargs.get('room')))
+        EMITS.inc(event=event, room=room)
+        if args:
+            payload = args[0]
+            if isinstance(payload, (str, bytes)):
+                EMIT_BYTES.inc(len(payload), room=room)
+            else:
+                # Serializing just to count would double the hot path's JSON
+                # work, so only a sample is measured and scaled up
+                rate = _settings['log_sample_rate']
+                if rate > 0 and random.random() < rate:
+                    EMIT_BYTES.inc(round(len(json.dumps(payload, default=str)) / rate), room=room)
+        return emit(event, *args, **kwargs)
+
+    socketio.on = on
+    socketio.emit = counted_emit
+
+
+def _start_request():
+    g._metrics_start = time.perf_counter()
+
+
+def _finish_request(response):
+    start = g.pop('_metrics_start', None)
+    if start is not None:
+        HTTP_SECONDS.observe(time.perf_counter() - start, endpoint=request.endpoint or 'unmatched',
+                             method=request.method, status=response.status_code)
+    return response
+
+
+def init_app(app, socketio):
+    """Record request, event, query and emit metrics; call before handlers are registered"""
+    _settings['log_sample_rate'] = app.config.setdefault('METRICS_LOG_SAMPLE_RATE', 0.01)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    if not getattr(socketio, '_metrics_installed', False):
+        _instrument_socketio(socketio)
+        socketio._metrics_installed = True
@@ -0,0 +1,254 @@
+import os
+import struct
+import threading
+
+import numpy as np
+
+from .db_pool import bulk_insert, get_db
+from .metrics import log_error
+
+# move number, point (y * size + x), colour, flags, clock stamp (mover's ms left)
+RECORD = struct.Struct('<IHBBI')
+PASS_POINT = 0xFFFF
+FLAG_CAPTURE = 1     # the point was emptied by this move
+FLAG_GAME_OVER = 2   # last record of a finished game
+
+
+class RecoveredGame:
+    """Game rebuilt from its journal when no JOURNAL_GAME_FACTORY is configured.
+
+    It can be watched and snapshotted but not played on.
+    """
+
+    def __init__(self, board_size=19):
+        self.board = np.zeros((board_size, board_size), dtype=np.int8)
+        self.move_history = []
+        self.current_player = 1
+        self.game_over = False
+        self.result_message = None
+
+
+class MoveJournal:
+    """Per-match append-only files of fixed-width move records.
+
+    append() only packs a record into an in-memory buffer. A background task
+    writes every buffer and fsyncs each touched file once per
+    JOURNAL_FLUSH_INTERVAL (group commit), and another periodically copies
+    new records into the MySQL moves table with multi-row inserts.
+    """
+
+    def __init__(self, directory=None, board_size=19):
+        self.directory = directory
+        self.board_size = board_size
+        self._pending = {}
+        self._files = {}
+        self._compacted = {}
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self.stats = {'records': 0, 'flushes': 0, 'fsyncs': 0, 'bytes_written': 0,
+                      'rows_compacted': 0}
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def path(self, match_id):
+        return os.path.join(self.directory, f"match_{match_id}.journal")
+
+    def append(self, match_id, move_number, point, color, flags=0, clock_ms=0):
+        if self.directory is None:
+            return
+        record = RECORD.pack(move_number, point, color, flags, clock_ms)
+        with self._lock:
+            self._pending.setdefault(match_id, bytearray()).extend(record)
+            self.stats['records'] += 1
+
+    def record_moves(self, match_id, first_number, moves, changes, clock_ms=0):
+        """Journal committed move_history entries, numbered from first_number,
+        and the (y, x, colour) points they changed.
+
+        Every move gets its own number, so no two stone or pass records
+        share a moves-table key; captures are filed under the last move.
+        """
+        size = self.board_size
+        number = first_number - 1
+        for number, move in enumerate(moves, first_number):
+            x, y = move.get('x'), move.get('y')
+            point = PASS_POINT if x is None else y * size + x
+            self.append(match_id, number, point, move.get('player', 0), 0, clock_ms)
+        for y, x, color in changes:
+            if not color:
+                self.append(match_id, number, y * size + x, 0, FLAG_CAPTURE, clock_ms)
+
+    def record_game_over(self, match_id, move_number):
+        self.append(match_id, move_number, PASS_POINT, 0, FLAG_GAME_OVER)
+
+    def flush(self):
+        """Group commit: one write and one fsync per touched journal"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        with self._io_lock:
+            for match_id, data in pending.items():
+                f = self._files.get(match_id)
+                if f is None:
+                    f = self._files[match_id] = open(self.path(match_id), 'ab')
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                self.stats['fsyncs'] += 1
+                self.stats['bytes_written'] += len(data)
+            self.stats['flushes'] += 1
+        return len(pending)
+
+    def match_ids(self):
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        return [int(name[6:-8]) for name in os.listdir(self.directory)
+                if name.startswith('match_') and name.endswith('.journal')]
+
+    def read(self, match_id):
+        with open(self.path(match_id), 'rb') as f:
+            data = f.read()
+        usable = len(data) - len(data) % RECORD.size  # ignore a torn last record
+        return list(RECORD.iter_unpack(data[:usable]))
+
+    def replay(self, records, game):
+        """Apply journal records to a fresh game object; returns each player's
+        last clock stamp in milliseconds"""
+        size = self.board_size
+        clock_ms_left = {}
+        for move_number, point, color, flags, clock_ms in records:
+            if flags & FLAG_GAME_OVER:
+                game.game_over = True
+            elif flags & FLAG_CAPTURE:
+                game.board[divmod(point, size)] = 0
+            else:
+                player = color or (1 if move_number % 2 else 2)
+                if point == PASS_POINT:
+                    x = y = None
+                else:
+                    y, x = divmod(point, size)
+                    game.board[y, x] = color
+                game.move_history.append({'x': x, 'y': y, 'player': player,
+                                          'move_number': move_number})
+                game.current_player = 3 - player
+                clock_ms_left[player] = clock_ms
+        game.journaled_moves = len(game.move_history)
+        return clock_ms_left
+
+    def compact(self, cursor):
+        """Copy records not yet in MySQL into the moves table.
+
+        Returns (offsets, finished, copied) for advance() to apply once the
+        caller has committed; nothing is marked copied or removed here, so a
+        rolled-back batch is simply copied again next time. After a restart
+        every journal is copied again from the start, and INSERT IGNORE skips
+        the rows that already made it.
+        """
+        offsets, finished, copied = {}, [], 0
+        for match_id in self.match_ids():
+            records = self.read(match_id)
+            start = self._compacted.get(match_id, 0)
+            size = self.board_size
+            rows = []
+            for move_number, point, color, flags, clock_ms in records[start:]:
+                if flags:
+                    continue
+                y, x = divmod(point, size) if point != PASS_POINT else (None, None)
+                rows.append((match_id, move_number, x, y, color, clock_ms))
+            if rows:
+                bulk_insert(cursor,
+                            "INSERT IGNORE INTO moves (match_id, move_number, x, y, color, clock_ms)",
+                            "(%s, %s, %s, %s, %s, %s)", rows)
+                copied += len(rows)
+            offsets[match_id] = len(records)
+            if records and records[-1][3] & FLAG_GAME_OVER:
+                finished.append(match_id)
+        return offsets, finished, copied
+
+    def advance(self, offsets, finished, copied):
+        """Record a committed compaction: move the offsets forward and
+        remove the journals of finished games"""
+        self._compacted.update(offsets)
+        for match_id in finished:
+            self.remove(match_id)
+        self.stats['rows_compacted'] += copied
+
+    def remove(self, match_id):
+        with self._io_lock:
+            f = self._files.pop(match_id, None)
+            if f is not None:
+                f.close()
+            self._compacted.pop(match_id, None)
+            try:
+                os.remove(self.path(match_id))
+            except FileNotFoundError:
+                pass
+
+
+move_journal = MoveJournal()
+
+
+def recover_games(factory=None):
+    """Rebuild unfinished games from their journals into active_games"""
+    # Import here to avoid circular imports
+    from .game_clock import restore_clock
+    from .game_state import add_game
+    from .match_runner import match_runner
+
+    recovered = []
+    for match_id in move_journal.match_ids():
+        records = move_journal.read(match_id)
+        if not records or records[-1][3] & FLAG_GAME_OVER:
+            continue
+        game = factory(match_id) if factory else RecoveredGame(move_journal.board_size)
+        clock_ms_left = move_journal.replay(records, game)
+        add_game(match_id, game, run_mode=None)
+        # Whoever is to move resumes with their saved time, and the timer
+        # wheel is re-armed from it rather than from the full initial time
+        restore_clock(match_id, {player: ms / 1000.0 for player, ms in clock_ms_left.items()},
+                      game.current_player)
+        if factory:
+            match_runner.start(match_id)
+        recovered.append(match_id)
+    return recovered
+
+
+def _flush_loop(socketio, interval):
+    while True:
+        socketio.sleep(interval)
+        move_journal.flush()
+
+
+def _compact_loop(app, socketio, interval):
+    while True:
+        socketio.sleep(interval)
+        with app.app_context():
+            db = get_db()
+            cursor = db.cursor()
+            try:
+                move_journal.flush()
+                compaction = move_journal.compact(cursor)
+                db.commit()
+                move_journal.advance(*compaction)
+            except Exception as e:
+                log_error("journal_compaction_failed", e)
+                db.rollback()
+            finally:
+                cursor.close()
+                db.close()
+
+
+def init_app(app, socketio):
+    """Open the journal directory, replay unfinished games and start the
+    group-commit and compaction tasks"""
+    directory = app.config.setdefault('JOURNAL_DIR', os.path.join(app.instance_path, 'journal'))
+    os.makedirs(directory, exist_ok=True)
+    move_journal.directory = directory
+    recover_games(app.config.get('JOURNAL_GAME_FACTORY'))
+    socketio.start_background_task(
+        _flush_loop, socketio, app.config.setdefault('JOURNAL_FLUSH_INTERVAL', 0.05))
+    socketio.start_background_task(
+        _compact_loop, app, socketio, app.config.setdefault('JOURNAL_COMPACT_INTERVAL', 30.0))
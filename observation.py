@@ -0,0 +1,118 @@
+"""Feature planes for agents, kept in shared memory and updated per move.
+
+Segment layout (read by agent_worker.py without importing this package):
+
+    int32[8] header: MAGIC, size, plane count, history length k,
+                     seq (bumped after each update), player to move,
+                     move number, last move as y * size + x (-1 for none)
+    uint8[planes, size, size] in PLANE_NAMES order, then k history planes,
+                     most recent move first
+
+The board plane holds 0/1/2 like the nested lists agents used to get, so
+it can stand in for them directly.
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .packed_board import BOARD_SIZE, EMPTY, BLACK, WHITE
+
+MAGIC = 0x47504C4E
+HEADER_FIELDS = 8
+HEADER_BYTES = HEADER_FIELDS * 4
+PLANE_NAMES = ('board', 'black', 'white', 'empty', 'liberties', 'legal')
+BOARD, BLACK_STONES, WHITE_STONES, EMPTY_POINTS, LIBERTIES, LEGAL = range(len(PLANE_NAMES))
+HISTORY = len(PLANE_NAMES)
+
+# Header slots
+H_MAGIC, H_SIZE, H_PLANES, H_HISTORY, H_SEQ, H_PLAYER, H_MOVE, H_LAST = range(HEADER_FIELDS)
+
+
+class ObservationBuffer:
+    """Shared-memory feature planes for one game, owned by the process playing it"""
+
+    def __init__(self, size=BOARD_SIZE, history=8):
+        self.size = size
+        self.history = history
+        self.nplanes = len(PLANE_NAMES) + history
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=HEADER_BYTES + self.nplanes * size * size)
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int32, buffer=self.shm.buf)
+        self.planes = np.ndarray((self.nplanes, size, size), dtype=np.uint8,
+                                 buffer=self.shm.buf, offset=HEADER_BYTES)
+        self.planes[:] = 0
+        self.planes[EMPTY_POINTS] = 1
+        self.header[:] = (MAGIC, size, self.nplanes, history, 0, BLACK, 0, -1)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def reset(self, engine, player):
+        """Rebuild every plane from an engine position"""
+        board = np.asarray(engine.board)
+        self.planes[BOARD] = board
+        self.planes[BLACK_STONES] = board == BLACK
+        self.planes[WHITE_STONES] = board == WHITE
+        self.planes[EMPTY_POINTS] = board == EMPTY
+        self.planes[HISTORY:] = 0
+        self._liberties(engine, np.flatnonzero(board).tolist())
+        self.planes[LEGAL] = engine.legal_mask(player)
+        self.header[H_PLAYER] = player
+        self.header[H_SEQ] += 1
+
+    def _liberties(self, engine, points):
+        """Rewrite the liberty plane for every group that has a stone in points"""
+        flat = self.planes[LIBERTIES].reshape(-1)
+        done = set()
+        for point in points:
+            if engine.colors[point] == EMPTY:
+                flat[point] = 0
+                continue
+            root = engine.find(point)
+            if root not in done:
+                done.add(root)
+                flat[engine.stones[root]] = min(len(engine.liberties[root]), 255)
+
+    def update(self, engine, move, color, captured, next_player):
+        """Apply one move: move is (x, y) or None for a pass, captured as
+        returned by GoEngine.play"""
+        size = self.size
+        history = self.planes[HISTORY:]
+        if self.history:
+            history[1:] = history[:-1]
+            history[0] = 0
+        touched = []
+        if move is not None:
+            x, y = move
+            point = y * size + x
+            for plane, value in ((BOARD, color), (BLACK_STONES, color == BLACK),
+                                 (WHITE_STONES, color == WHITE), (EMPTY_POINTS, 0)):
+                self.planes[plane, y, x] = value
+            if self.history:
+                history[0, y, x] = 1
+            touched.append(point)
+            touched.extend(engine.neighbours[point])
+            self.header[H_LAST] = point
+        else:
+            self.header[H_LAST] = -1
+        for cx, cy in captured:
+            self.planes[BOARD, cy, cx] = EMPTY
+            self.planes[BLACK_STONES, cy, cx] = 0
+            self.planes[WHITE_STONES, cy, cx] = 0
+            self.planes[EMPTY_POINTS, cy, cx] = 1
+            point = cy * size + cx
+            touched.append(point)
+            touched.extend(engine.neighbours[point])
+        # Only groups next to the move or the captures can have changed liberties
+        self._liberties(engine, touched)
+        self.planes[LEGAL] = engine.legal_mask(next_player)
+        self.header[H_PLAYER] = next_player
+        self.header[H_MOVE] += 1
+        self.header[H_SEQ] += 1
+
+    def close(self):
+        """Release and remove the segment; views into it must not be used afterwards"""
+        self.header = self.planes = None
+        self.shm.close()
+        self.shm.unlink()
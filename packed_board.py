@@ -0,0 +1,122 @@
+import random
+
+import numpy as np
+
+BOARD_SIZE = 19
+EMPTY, BLACK, WHITE = 0, 1, 2
+
+# Fixed seed so every worker process computes the same hash for a position
+_rng = random.Random(0x60B0A4D)
+ZOBRIST = [(0, _rng.getrandbits(64), _rng.getrandbits(64))
+           for _ in range(BOARD_SIZE * BOARD_SIZE)]
+
+
+class PackedBoard:
+    """Go board packed 2 bits per point (91 bytes for 19x19).
+
+    A compact copy of a position for storage, transport and diffing, not a
+    stand-in for the NumPy board games play on: only board[y, x] reads and
+    writes, tolist(), shape and np.asarray() are supported. The Zobrist
+    hash is kept in the zobrist attribute and updated on every write, and
+    buffer() exposes the packed bytes without copying. Boards are mutable,
+    so they compare by position but are not hashable; key on zobrist instead.
+    """
+
+    __slots__ = ('size', 'zobrist', '_cells')
+
+    def __init__(self, size=BOARD_SIZE, data=None):
+        self.size = size
+        nbytes = (size * size + 3) // 4
+        self._cells = bytearray(nbytes) if data is None else bytearray(data)
+        if len(self._cells) != nbytes:
+            raise ValueError(f"expected {nbytes} bytes for a {size}x{size} board")
+        self.zobrist = 0
+        if data is not None:
+            for point in range(size * size):
+                self.zobrist ^= ZOBRIST[point][self._get(point)]
+
+    @classmethod
+    def from_array(cls, array):
+        """Pack a NumPy (or nested list) board of 0/1/2 values"""
+        flat = np.asarray(array, dtype=np.uint8).ravel()
+        size = int(round(len(flat) ** 0.5))
+        padded = np.zeros((len(flat) + 3) // 4 * 4, dtype=np.uint8)
+        padded[:len(flat)] = flat
+        packed = padded[0::4] | (padded[1::4] << 2) | (padded[2::4] << 4) | (padded[3::4] << 6)
+        board = cls(size)
+        board._cells[:] = packed.tobytes()
+        for point in np.flatnonzero(flat).tolist():
+            board.zobrist ^= ZOBRIST[point][int(flat[point])]
+        return board
+
+    @classmethod
+    def from_bytes(cls, data, size=BOARD_SIZE):
+        return cls(size, data)
+
+    @property
+    def shape(self):
+        return (self.size, self.size)
+
+    def _get(self, point):
+        return (self._cells[point >> 2] >> ((point & 3) << 1)) & 3
+
+    def __getitem__(self, yx):
+        y, x = yx
+        return self._get(y * self.size + x)
+
+    def __setitem__(self, yx, color):
+        y, x = yx
+        point = y * self.size + x
+        shift = (point & 3) << 1
+        old = (self._cells[point >> 2] >> shift) & 3
+        if old == color:
+            return
+        self._cells[point >> 2] = (self._cells[point >> 2] & ~(3 << shift) & 0xFF) | (color << shift)
+        self.zobrist ^= ZOBRIST[point][old] ^ ZOBRIST[point][color]
+
+    def copy(self):
+        board = PackedBoard.__new__(PackedBoard)
+        board.size = self.size
+        board.zobrist = self.zobrist
+        board._cells = bytearray(self._cells)
+        return board
+
+    def assign(self, other):
+        """Overwrite this board in place with another position"""
+        if not isinstance(other, PackedBoard):
+            other = PackedBoard.from_array(other)
+        self._cells[:] = other._cells
+        self.zobrist = other.zobrist
+
+    def buffer(self):
+        """Zero-copy view of the packed bytes"""
+        return memoryview(self._cells)
+
+    def __bytes__(self):
+        return bytes(self._cells)
+
+    def __eq__(self, other):
+        if not isinstance(other, PackedBoard):
+            return NotImplemented
+        return self.zobrist == other.zobrist and self._cells == other._cells
+
+    def __array__(self, dtype=None, copy=None):
+        cells = np.frombuffer(self._cells, dtype=np.uint8)
+        points = np.stack([(cells >> shift) & 3 for shift in (0, 2, 4, 6)], axis=1)
+        array = points.ravel()[:self.size * self.size].reshape(self.shape)
+        return array if dtype is None else array.astype(dtype)
+
+    def tolist(self):
+        return np.asarray(self).tolist()
+
+    def diff(self, other):
+        """(y, x, colour) for every point where `other` differs from this board"""
+        if not isinstance(other, PackedBoard):
+            other = PackedBoard.from_array(other)
+        changed = int.from_bytes(self._cells, 'little') ^ int.from_bytes(other._cells, 'little')
+        points = []
+        while changed:
+            point = ((changed & -changed).bit_length() - 1) >> 1
+            changed &= ~(3 << (point << 1))
+            points.append((point // self.size, point % self.size, other._get(point)))
+        return points
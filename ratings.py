@@ -0,0 +1,166 @@
+import threading
+
+import numpy as np
+
+from .db_pool import get_db
+from .leaderboard import leaderboard
+from .metrics import log_error
+from .packed_board import EMPTY, BLACK, WHITE
+
+# Score from player1's (black's) point of view
+SCORES = {BLACK: 1.0, WHITE: 0.0, EMPTY: 0.5}
+
+
+def expected_scores(ratings_a, ratings_b):
+    return 1.0 / (1.0 + 10.0 ** ((ratings_b - ratings_a) / 400.0))
+
+
+def elo_deltas(ratings, player1, player2, scores, k_factor=32):
+    """Rating change per player for a whole batch of games.
+
+    player1/player2 are indexes into ratings, scores are player1's results.
+    Every game in the batch is rated against the ratings from before the
+    batch, as in an Elo rating period, so a player's games within one batch
+    don't depend on the order they finished in.
+    """
+    expected = expected_scores(ratings[player1], ratings[player2])
+    change = k_factor * (scores - expected)
+    deltas = np.zeros(len(ratings))
+    np.add.at(deltas, player1, change)
+    np.add.at(deltas, player2, -change)
+    return np.rint(deltas).astype(int)
+
+
+class RatingEngine:
+    """Collects finished games and applies their Elo changes in batches.
+
+    A batch costs one SELECT for the players' current ratings and one
+    UPDATE for every rating it changes, however many games it holds.
+    """
+
+    def __init__(self, k_factor=32, batch_size=500):
+        self.k_factor = k_factor
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        self.counters = {'games_rated': 0, 'games_skipped': 0, 'batches': 0}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, match_id, winner):
+        """Queue a result; winner is BLACK (player1), WHITE (player2) or EMPTY for a draw"""
+        with self._lock:
+            self._pending.append((match_id, SCORES[winner]))
+
+    def take_batch(self):
+        with self._lock:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+        return batch
+
+    def flush(self, db, cursor):
+        """Rate up to batch_size queued games; returns how many were rated"""
+        batch = self.take_batch()
+        if not batch:
+            return 0
+        try:
+            rated, changed = self._apply(cursor, batch)
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Put the batch back so the next flush retries it
+            with self._lock:
+                self._pending[:0] = batch
+            raise
+        for user_id, delta in changed:
+            leaderboard.adjust(user_id, delta)
+        with self._lock:
+            self.counters['games_rated'] += rated
+            self.counters['games_skipped'] += len(batch) - rated
+            self.counters['batches'] += 1
+        return rated
+
+    def _apply(self, cursor, batch):
+        scores_by_match = dict(batch)
+        match_ids = list(scores_by_match)
+        cursor.execute(
+            "SELECT m.id, m.player1_id, m.player2_id, u1.elo AS elo1, u2.elo AS elo2 "
+            "FROM matches m "
+            "JOIN users u1 ON u1.id = m.player1_id "
+            "JOIN users u2 ON u2.id = m.player2_id "
+            "WHERE m.id IN (" + ", ".join(["%s"] * len(match_ids)) + ")",
+            match_ids
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return 0, []
+
+        player_ids = sorted({row['player1_id'] for row in rows} | {row['player2_id'] for row in rows})
+        player_index = {user_id: i for i, user_id in enumerate(player_ids)}
+        ratings = np.zeros(len(player_ids))
+        for row in rows:
+            ratings[player_index[row['player1_id']]] = row['elo1']
+            ratings[player_index[row['player2_id']]] = row['elo2']
+
+        player1 = np.fromiter((player_index[row['player1_id']] for row in rows), int, len(rows))
+        player2 = np.fromiter((player_index[row['player2_id']] for row in rows), int, len(rows))
+        scores = np.fromiter((scores_by_match[row['id']] for row in rows), float, len(rows))
+        deltas = elo_deltas(ratings, player1, player2, scores, self.k_factor)
+
+        changed = [(player_ids[i], int(delta)) for i, delta in enumerate(deltas) if delta]
+        if changed:
+            # Apply deltas rather than absolute ratings so a concurrent write
+            # to users.elo is never overwritten
+            params = [value for pair in changed for value in pair]
+            cursor.execute(
+                "UPDATE users SET elo = elo + CASE id "
+                + " ".join(["WHEN %s THEN %s"] * len(changed))
+                + " END WHERE id IN (" + ", ".join(["%s"] * len(changed)) + ")",
+                params + [user_id for user_id, _ in changed]
+            )
+        return len(rows), changed
+
+
+rating_engine = RatingEngine()
+
+
+def game_winner(game):
+    """BLACK, WHITE or EMPTY (draw) for a finished game, None if it has no result"""
+    return getattr(game, 'winner', None)
+
+
+def record_game(match_id, game):
+    """Match runner finish listener: queue the game for rating"""
+    winner = game_winner(game)
+    if winner is not None:
+        rating_engine.submit(match_id, winner)
+
+
+def _flush_loop(app, socketio, interval):
+    while True:
+        socketio.sleep(interval)
+        while len(rating_engine):
+            with app.app_context():
+                db = get_db()
+                cursor = db.cursor(dictionary=True)
+                try:
+                    rating_engine.flush(db, cursor)
+                except Exception as e:
+                    log_error("rating_flush_failed", e)
+                    break
+                finally:
+                    cursor.close()
+                    db.close()
+
+
+def init_app(app, socketio):
+    """Rate finished games in batches (RATING_K_FACTOR, RATING_BATCH_SIZE, RATING_FLUSH_INTERVAL)"""
+    # Import here to avoid circular imports
+    from .match_runner import match_runner
+
+    rating_engine.k_factor = app.config.setdefault('RATING_K_FACTOR', 32)
+    rating_engine.batch_size = app.config.setdefault('RATING_BATCH_SIZE', 500)
+    match_runner.add_finish_listener(record_game)
+    socketio.start_background_task(
+        _flush_loop, app, socketio, app.config.setdefault('RATING_FLUSH_INTERVAL', 5.0))
@@ -0,0 +1,168 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .go_rules import GoEngine, IllegalMove
+
+
+class Replay:
+    """One game's positions as a snapshot every interval moves plus the
+    points each move changed.
+
+    Position n is the snapshot at or before it with at most interval - 1
+    deltas applied, so any move is rebuilt in O(interval) however long the
+    game is.
+    """
+
+    def __init__(self, size, interval=32):
+        self.size = size
+        self.interval = interval
+        self.moves = []
+        self.deltas = []
+        self.snapshots = [np.zeros((size, size), dtype=np.int8)]
+        self._board = self.snapshots[0].copy()
+
+    def __len__(self):
+        return len(self.moves)
+
+    def append(self, move, changes):
+        """Add the next move; changes are the (y, x, colour) points it set"""
+        delta = np.array(changes, dtype=np.int16).reshape(-1, 3)
+        self._board[delta[:, 0], delta[:, 1]] = delta[:, 2]
+        self.moves.append(move)
+        self.deltas.append(delta)
+        if len(self.moves) % self.interval == 0:
+            self.snapshots.append(self._board.copy())
+
+    def board_at(self, n):
+        """Board after the first n moves"""
+        if not 0 <= n <= len(self.moves):
+            raise IndexError(n)
+        base = n // self.interval
+        board = self.snapshots[base].copy()
+        for delta in self.deltas[base * self.interval:n]:
+            board[delta[:, 0], delta[:, 1]] = delta[:, 2]
+        return board
+
+    @classmethod
+    def from_history(cls, move_history, size, interval=32):
+        """Rebuild from move_history alone, recomputing captures"""
+        replay = cls(size, interval)
+        engine = GoEngine(size)
+        for move in move_history:
+            x, y, color = move.get('x'), move.get('y'), move.get('player')
+            changes = []
+            if x is not None:
+                try:
+                    captured = engine.play(x, y, color)
+                except IllegalMove:
+                    # Rules the engine does not share; keep the stone, skip
+                    # captures and carry on from the resulting position
+                    captured = []
+                    board = replay._board.copy()
+                    board[y, x] = color
+                    engine = GoEngine(size, board=board)
+                changes = [(y, x, color)] + [(cy, cx, 0) for cx, cy in captured]
+            replay.append(move, changes)
+        return replay
+
+
+class ReplayStore:
+    """Replays of live games, fed one move at a time by the process driving
+    each game and rebuilt from move_history anywhere else.
+
+    Only max_games replays are kept, least recently used first out; an
+    evicted game is simply rebuilt on its next request.
+    """
+
+    def __init__(self, interval=32, max_games=10000, page_size=100):
+        self.interval = interval
+        self.max_games = max_games
+        self.page_size = page_size
+        self._replays = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'appended': 0, 'rebuilt': 0, 'evicted': 0}
+
+    def _store(self, match_id, replay):
+        self._replays[match_id] = replay
+        self._replays.move_to_end(match_id)
+        while len(self._replays) > self.max_games:
+            self._replays.popitem(last=False)
+            self.stats['evicted'] += 1
+
+    def _rebuild(self, match_id, game):
+        replay = Replay.from_history(game.move_history, game.board.shape[0], self.interval)
+        self.stats['rebuilt'] += 1
+        self._store(match_id, replay)
+        return replay
+
+    def record(self, match_id, game, changes):
+        """Add a freshly committed move from the board diff the broadcast made"""
+        with self._lock:
+            replay = self._replays.get(match_id)
+            if replay is None:
+                # A game's first move starts its replay
+                replay = Replay(game.board.shape[0], self.interval)
+                self._store(match_id, replay)
+            moves = len(game.move_history)
+            if len(replay) == moves:
+                return
+            if len(replay) + 1 == moves:
+                replay.append(game.move_history[-1], changes)
+                self.stats['appended'] += 1
+            else:
+                # Several moves in one broadcast: the diff cannot be split
+                self._rebuild(match_id, game)
+
+    def get(self, match_id, game):
+        """The game's replay, rebuilt if missing or behind move_history"""
+        with self._lock:
+            replay = self._replays.get(match_id)
+            if replay is None or len(replay) != len(game.move_history):
+                return self._rebuild(match_id, game)
+            self._replays.move_to_end(match_id)
+            return replay
+
+    def forget(self, match_id):
+        with self._lock:
+            self._replays.pop(match_id, None)
+
+
+replay_store = ReplayStore()
+
+
+def history_page(game, start=None, count=None):
+    """Slice of move_history; without start, the last count moves"""
+    count = min(count or replay_store.page_size, replay_store.page_size)
+    total = len(game.move_history)
+    if start is None:
+        start = max(total - count, 0)
+    start = min(max(start, 0), total)
+    return {
+        'move_count': total,
+        'history_start': start,
+        'move_history': game.move_history[start:start + count],
+    }
+
+
+def seek_position(match_id, game, move_number):
+    """Board and last move after move_number moves, clamped to the game"""
+    replay = replay_store.get(match_id, game)
+    n = min(max(move_number, 0), len(replay))
+    last_move = replay.moves[n - 1] if n else None
+    return {
+        'match_id': match_id,
+        'move_number': n,
+        'move_count': len(replay),
+        'board': replay.board_at(n).tolist(),
+        'last_move': last_move,
+        'current_player': 3 - last_move['player'] if last_move else 1,
+    }
+
+
+def init_app(app):
+    """Size the replay store (REPLAY_SNAPSHOT_INTERVAL, REPLAY_MAX_GAMES, MOVE_HISTORY_PAGE_SIZE)"""
+    replay_store.interval = app.config.setdefault('REPLAY_SNAPSHOT_INTERVAL', 32)
+    replay_store.max_games = app.config.setdefault('REPLAY_MAX_GAMES', 10000)
+    replay_store.page_size = app.config.setdefault('MOVE_HISTORY_PAGE_SIZE', 100)
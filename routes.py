@@ -1,21 +1,29 @@
-import os
-import time
 from flask import render_template, request, flash, redirect, url_for, session, current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-import mysql.connector
 from mysql.connector import IntegrityError, Error
 
 from . import bp1
 from . import bp2
-
-def get_db():
-    return mysql.connector.connect(
-        host='localhost',
-        user='root',
-        password='',
-        database='register'
-    )
+from ..agent_store import AgentTooLarge, queue_prepare, register_agent
+from ..db_pool import get_db
+from ..leaderboard import leaderboard
+from ..matchmaking import matchmaking_queue, record_pairing, broadcast_match_ready
+from ..metrics import log_error
+
+USER_BY_NAME_QUERY = "SELECT * FROM users WHERE username = %s"
+MATCH_PLAYER_QUERY = """
+    SELECT u.id, u.username, u.elo, u.agentFile, u.agent_hash, a.status AS agent_status
+    FROM users u
+    LEFT JOIN agents a ON a.hash = u.agent_hash
+    WHERE u.id = %s
+"""
+OPEN_MATCH_QUERY = """
+    SELECT id FROM matches
+    WHERE (player1_id = %s OR player2_id = %s)
+    AND status IN ('waiting', 'active')
+    LIMIT 1
+"""
 
 @bp1.route('/register', methods=['GET', 'POST'])
 def register():
@@ -39,33 +47,41 @@ def register():
             flash('File is required.')
             return render_template('auth/register.html')
         else:
-            _, ext = os.path.splitext(secure_filename(agentFile.filename))
-            filename = f"{secure_filename(username)}_{int(time.time())}{ext}"
-            UPLOAD_FOLDER = f"{username}"
-            if not os.path.exists(UPLOAD_FOLDER):
-                os.makedirs(UPLOAD_FOLDER)
-            agentFile.save(os.path.join(UPLOAD_FOLDER, filename))
+            filename = secure_filename(agentFile.filename)
 
         if error is None:
             db = get_db()
             cursor = db.cursor()
             try:
-                cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
+                cursor.execute(USER_BY_NAME_QUERY, (username,))
                 account = cursor.fetchone()
                 if account:
                     error = f"User {username} is already registered."
                 else:
                     hashed_password = generate_password_hash(password)
+                    # The user row goes first, so a duplicate username fails
+                    # before anything is written to the agent store
                     cursor.execute(
                         "INSERT INTO users (username, email, password, agentFile) VALUES (%s, %s, %s, %s)",
                         (username, email, hashed_password, filename)
                     )
+                    user_id = cursor.lastrowid
+                    # Streamed into the content-addressed store; prepared in the background
+                    agent_hash, new_agent = register_agent(cursor, agentFile.stream)
+                    cursor.execute("UPDATE users SET agent_hash = %s WHERE id = %s",
+                                   (agent_hash, user_id))
                     db.commit()
+                    if new_agent:
+                        queue_prepare(agent_hash)
+                    leaderboard.update(user_id, 1500, username)
                     flash('Registration successful! Please log in.')
                     return redirect(url_for('auth.login'))
             except IntegrityError:
                 flash(f"User {username} is already registered.")
                 return render_template('auth/register.html')
+            except AgentTooLarge as e:
+                flash(str(e))
+                return render_template('auth/register.html')
             except Exception as e:
                 flash(f"An error occurred: {str(e)}")
                 return render_template('auth/register.html')
@@ -84,7 +100,7 @@ def login():
         db = get_db()
         cursor = db.cursor(dictionary=True, buffered=True)
         try:
-            cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
+            cursor.execute(USER_BY_NAME_QUERY, (username,))
             username = cursor.fetchone()
             if username is None:
                 error = 'Incorrect username.'
@@ -107,6 +123,7 @@ def login():
 
 @bp1.route('/logout')
 def logout():
+    matchmaking_queue.dequeue(session.get('user_id'))
     session.clear()
     flash('You have been logged out.')
     return redirect(url_for('auth.login'))
@@ -126,91 +143,64 @@ def find_match():
         flash('You must be logged in to find a match.')
         return redirect(url_for('auth.login'))
 
+    if session['user_id'] in matchmaking_queue:
+        flash('Waiting for opponent with similar ELO...')
+        return redirect(url_for('templates.index'))
+
     db = get_db()
     cursor = db.cursor(dictionary=True, buffered=True)
+    opponent = None
     
     try:
         # Get current user's info
-        cursor.execute("SELECT id, username, elo, agentFile FROM users WHERE id = %s",
-                     (session['user_id'],))
+        cursor.execute(MATCH_PLAYER_QUERY, (session['user_id'],))
         current_user = cursor.fetchone()
 
         if not current_user:
             flash('User profile not found.')
             return redirect(url_for('templates.index'))
 
+        # Agents only become eligible once the preparation stage has passed them
+        if current_user['agent_hash'] and current_user['agent_status'] != 'ready':
+            if current_user['agent_status'] == 'failed':
+                flash('Your agent failed validation. Please upload a new one.')
+            else:
+                flash('Your agent is still being prepared. Try again in a moment.')
+            return redirect(url_for('templates.index'))
+
         # Check existing matches
-        cursor.execute("""
-            SELECT * FROM matches 
-            WHERE (player1_id = %s OR player2_id = %s)
-            AND status IN ('waiting', 'active')
-        """, (session['user_id'], session['user_id']))
+        cursor.execute(OPEN_MATCH_QUERY, (session['user_id'], session['user_id']))
         existing_match = cursor.fetchone()
 
         if existing_match:
             flash('You already have an active or pending match.')
             return redirect(url_for('templates.index'))
 
-        # ELO match parameters
-        elo_threshold = 200
-        current_elo = current_user['elo']
-        min_elo = current_elo - elo_threshold
-        max_elo = current_elo + elo_threshold
-
-        # Find suitable match
-        cursor.execute("""
-            SELECT m.id, m.player1_id, u.username, u.elo, u.agentFile
-            FROM matches m
-            JOIN users u ON m.player1_id = u.id
-            WHERE m.status = 'waiting'
-            AND u.id != %s
-            AND u.elo BETWEEN %s AND %s
-            ORDER BY ABS(u.elo - %s)
-            LIMIT 1
-        """, (session['user_id'], min_elo, max_elo, current_elo))
-        waiting_match = cursor.fetchone()
-
-        if waiting_match:
-            # Update match and notify both players
-            cursor.execute("""
-                UPDATE matches
-                SET player2_id = %s, status = 'active'
-                WHERE id = %s
-            """, (session['user_id'], waiting_match['id']))
+        # Pair against the in-memory Elo index; only the final pairing hits MySQL
+        opponent = matchmaking_queue.enqueue(
+            current_user['id'], current_user['elo'], current_user['username'])
+
+        if opponent:
+            match_id = record_pairing(cursor, opponent, current_user['id'])
             db.commit()
 
-            flash(f"Match found! Your AI agent will play against {waiting_match['username']} (ELO: {waiting_match['elo']})")
+            flash(f"Match found! Your AI agent will play against {opponent.username} (ELO: {opponent.elo})")
 
             # Socket.IO notifications
             try:
-                socketio = current_app.socketio
-                # Notify first player
-                socketio.emit(
-                    'match_ready',
-                    {'match_id': waiting_match['id']},
-                    room=f"user_{waiting_match['player1_id']}"
-                )
-                # Notify second player
-                socketio.emit(
-                    'match_ready', 
-                    {'match_id': waiting_match['id']},
-                    room=f"user_{session['user_id']}"
-                )
+                broadcast_match_ready(current_app.socketio, match_id,
+                                      opponent.user_id, current_user['id'])
             except Exception as e:
-                print(f"SocketIO error: {e}")
+                log_error("match_ready_emit_failed", e, match_id=match_id)
 
-            return redirect(url_for('game.game_view', match_id=waiting_match['id']))
+            return redirect(url_for('game.game_view', match_id=match_id))
         else:
-            # Create new waiting match
-            cursor.execute("""
-                INSERT INTO matches (player1_id, status)
-                VALUES (%s, 'waiting')
-            """, (session['user_id'],))
-            db.commit()
             flash('Waiting for opponent with similar ELO...')
             return redirect(url_for('templates.index'))
 
     except Error as e:
+        if opponent:
+            matchmaking_queue.requeue(opponent)
         flash(f"Database error: {str(e)}")
         return redirect(url_for('templates.index'))
     finally:
@@ -0,0 +1,172 @@
+from collections import namedtuple
+
+import numpy as np
+
+from .packed_board import EMPTY, BLACK, WHITE
+
+KOMI = 6.5
+
+AREA, TERRITORY = 'area', 'territory'
+# Dead-stone policies: 'none' keeps every stone (Tromp-Taylor), 'atari'
+# removes groups with one liberty left, 'enclosed' removes stones walled
+# into a small area by the opponent with fewer than two eyes there
+DEAD_POLICIES = ('none', 'atari', 'enclosed')
+
+Score = namedtuple('Score', 'black white komi winner margin ownership dead')
+
+
+def _shifts(array, fill):
+    """The four orthogonal neighbours of every point, padded with fill"""
+    padded = np.full((array.shape[0] + 2, array.shape[1] + 2), fill, dtype=array.dtype)
+    padded[1:-1, 1:-1] = array
+    return padded[:-2, 1:-1], padded[2:, 1:-1], padded[1:-1, :-2], padded[1:-1, 2:]
+
+
+def label(mask):
+    """Connected components of mask (4-neighbourhood).
+
+    Every point starts with its own index as a label; labels flow to the
+    smallest neighbouring label in the same component, with pointer
+    jumping, until nothing changes. Points outside mask are -1.
+    """
+    size = mask.shape[0]
+    big = size * size
+    labels = np.where(mask, np.arange(big).reshape(mask.shape), big)
+    while True:
+        smallest = labels
+        for neighbour in _shifts(labels, big):
+            smallest = np.minimum(smallest, np.where(mask, neighbour, big))
+        flat = np.append(smallest.ravel(), big)
+        # Pointer jumping: follow labels to their labels' labels
+        jumped = flat[flat][:-1].reshape(mask.shape)
+        jumped = np.where(mask, jumped, big)
+        if np.array_equal(jumped, labels):
+            return np.where(mask, labels, -1)
+        labels = jumped
+
+
+def _touching(labels, color_mask, npoints):
+    """Which component labels have a point next to a stone of color_mask"""
+    touches = np.zeros(npoints, dtype=bool)
+    near = np.zeros_like(color_mask)
+    for neighbour in _shifts(color_mask, False):
+        near |= neighbour
+    hits = labels[near & (labels >= 0)]
+    touches[hits] = True
+    return touches
+
+
+def influence(board, iterations=4):
+    """Diffused +black / -white influence; positive means black's sphere"""
+    field = (board == BLACK).astype(np.float32) - (board == WHITE).astype(np.float32)
+    for _ in range(iterations):
+        up, down, left, right = _shifts(field, 0.0)
+        field = field + 0.5 * (up + down + left + right) / 4
+    return field
+
+
+def _liberty_counts(board, groups, npoints):
+    """Liberties of every group label: distinct empty points next to it"""
+    empty = board == EMPTY
+    empty_points = np.flatnonzero(empty)
+    # (group, empty point) pairs packed into one int so np.unique can drop
+    # a liberty seen from two sides of the same group
+    pairs = np.concatenate([neighbour[empty] * npoints + empty_points
+                            for neighbour in _shifts(groups, -1)])
+    owners = np.unique(pairs[pairs >= 0]) // npoints
+    return np.bincount(owners, minlength=npoints)
+
+
+def _enclosed(board, color, npoints, max_region):
+    """Stones of color walled in by the opponent in a small area without two eyes"""
+    opponent = 3 - color
+    # Everything color could still reach without crossing opponent stones
+    areas = label(board != opponent)
+    area_size = np.bincount(areas[areas >= 0], minlength=npoints)
+    # Eyes: empty patches bordered by color alone
+    empty = board == EMPTY
+    patches = label(empty)
+    bad = _touching(patches, board == opponent, npoints)
+    eye_patches = np.unique(patches[empty & ~bad[np.maximum(patches, 0)]])
+    eyes = np.bincount(areas.ravel()[eye_patches], minlength=npoints)
+    area_ids = np.maximum(areas, 0)
+    return (board == color) & (area_size[area_ids] <= max_region) & (eyes[area_ids] < 2)
+
+
+def dead_stones(board, policy='none', max_region=40):
+    """Boolean map of stones treated as dead under policy"""
+    dead = np.zeros(board.shape, dtype=bool)
+    if policy == 'none':
+        return dead
+    if policy not in DEAD_POLICIES:
+        raise ValueError(f"unknown dead-stone policy {policy!r}")
+    npoints = board.size
+    for color in (BLACK, WHITE):
+        if policy == 'atari':
+            stones = board == color
+            groups = label(stones)
+            weak = _liberty_counts(board, groups, npoints) == 1
+            dead |= stones & weak[np.maximum(groups, 0)]
+        else:
+            dead |= _enclosed(board, color, npoints, max_region)
+    return dead
+
+
+def score(board, komi=KOMI, rules=AREA, dead_policy='none', captures=None):
+    """Final score of a position.
+
+    Area scoring counts stones plus surrounded empty points. Territory
+    scoring counts surrounded empty points plus prisoners, where captures
+    is {BLACK: stones black captured, WHITE: ...}. Dead stones are taken
+    off first, count as prisoners, and their points as territory. The
+    ownership map is +1 black, -1 white, 0 for dame.
+    """
+    board = np.asarray(board)
+    dead = dead_stones(board, dead_policy)
+    alive = np.where(dead, EMPTY, board)
+    empty = alive == EMPTY
+    regions = label(empty)
+    npoints = board.size
+    black_near = _touching(regions, alive == BLACK, npoints)
+    white_near = _touching(regions, alive == WHITE, npoints)
+    region_ids = np.maximum(regions, 0)
+    black_territory = empty & black_near[region_ids] & ~white_near[region_ids]
+    white_territory = empty & white_near[region_ids] & ~black_near[region_ids]
+
+    ownership = np.zeros(board.shape, dtype=np.int8)
+    ownership[(alive == BLACK) | black_territory] = 1
+    ownership[(alive == WHITE) | white_territory] = -1
+
+    if rules == AREA:
+        black = int(np.count_nonzero(ownership == 1))
+        white = int(np.count_nonzero(ownership == -1))
+    elif rules == TERRITORY:
+        captures = captures or {}
+        black = (int(black_territory.sum()) + captures.get(BLACK, 0)
+                 + int((dead & (board == WHITE)).sum()))
+        white = (int(white_territory.sum()) + captures.get(WHITE, 0)
+                 + int((dead & (board == BLACK)).sum()))
+    else:
+        raise ValueError(f"unknown rules {rules!r}")
+    white_total = white + komi
+    winner = BLACK if black > white_total else WHITE if white_total > black else EMPTY
+    return Score(black, white_total, komi, winner, abs(black - white_total), ownership, dead)
+
+
+def estimate(board, komi=KOMI):
+    """Live estimate for spectators: enclosed stones count as dead and
+    influence decides any point not yet surrounded"""
+    board = np.asarray(board)
+    result = score(board, komi, AREA, 'enclosed')
+    unsettled = result.ownership == 0
+    if unsettled.any():
+        field = influence(np.where(result.dead, EMPTY, board))
+        ownership = result.ownership.copy()
+        ownership[unsettled & (field > 0.05)] = 1
+        ownership[unsettled & (field < -0.05)] = -1
+        black = int(np.count_nonzero(ownership == 1))
+        white = int(np.count_nonzero(ownership == -1)) + komi
+        winner = BLACK if black > white else WHITE if white > black else EMPTY
+        result = result._replace(black=black, white=white, winner=winner,
+                                 margin=abs(black - white), ownership=ownership)
+    return result
@@ -0,0 +1,219 @@
+import json
+import threading
+
+from .game_clock import clock_payload
+from .metrics import log_error
+from .packed_board import PackedBoard
+from .replay import history_page
+from .scoring import estimate
+
+
+def spectator_room(match_id):
+    return f"spectate_{match_id}"
+
+
+def ticker_room(tournament_id):
+    return f"ticker_{tournament_id}"
+
+
+class SpectatorChannel:
+    """Rate-capped fan-out for people watching games they are not playing.
+
+    Players keep getting every move on game_{match_id}. Spectators join
+    spectate_{match_id} instead, where all moves made since the last frame
+    are coalesced into one frame and sent at most max_fps times a second.
+    Frames are serialized to JSON once and emitted to the room as a string,
+    so the cost doesn't grow with the number of viewers.
+
+    In a single process only games someone is watching get frames: watch()
+    and unwatch() track each room's sockets, and a game's view is dropped
+    when it ends or its room empties. With a shared game-state backend or a
+    message queue a spectator may be connected to another process than the
+    one running the game, so every changed game gets frames there.
+
+    The tournament ticker (ticker_{tournament_id}) carries one compact
+    entry per changed game of a tournament every ticker_interval seconds.
+    """
+
+    def __init__(self, max_fps=4, ticker_interval=1.0, score_estimate=True, estimate_every=4):
+        self.max_fps = max_fps
+        self.score_estimate = score_estimate
+        self.estimate_every = estimate_every
+        self.ticker_interval = ticker_interval
+        self.socketio = None
+        self._dirty = {}
+        self._views = {}
+        self.watched_only = True
+        self._watchers = {}
+        self._watching = {}
+        self._ticker = {}
+        self._lock = threading.Lock()
+        self.counters = {'published': 0, 'frames': 0, 'ticker_frames': 0}
+
+    def publish(self, match_id, game):
+        """Note that a game changed; the next frame picks up its latest state"""
+        with self._lock:
+            if not self.watched_only or match_id in self._watchers:
+                self._dirty[match_id] = game
+            self.counters['published'] += 1
+        tournament_id = getattr(game, 'tournament_id', None)
+        if tournament_id is not None:
+            self.ticker(tournament_id, match_id, moves=len(game.move_history),
+                        current_player=game.current_player, game_over=game.game_over)
+
+    def ticker(self, tournament_id, match_id, **update):
+        """Queue a compact update for a tournament's live ticker; later updates
+        for the same game replace earlier ones"""
+        with self._lock:
+            games = self._ticker.setdefault(tournament_id, {})
+            games.setdefault(match_id, {'match_id': match_id}).update(update)
+
+    def watch(self, match_id, sid):
+        """Count sid as a spectator of match_id"""
+        with self._lock:
+            self._watchers.setdefault(match_id, set()).add(sid)
+            self._watching.setdefault(sid, set()).add(match_id)
+
+    def unwatch(self, match_id, sid):
+        """Stop counting sid; the last one out drops the game's view"""
+        with self._lock:
+            self._unwatch(match_id, sid)
+
+    def leave(self, sid):
+        """Forget a disconnected socket in every room it watched"""
+        with self._lock:
+            for match_id in self._watching.get(sid, ()).copy():
+                self._unwatch(match_id, sid)
+
+    def _unwatch(self, match_id, sid):
+        watchers = self._watchers.get(match_id)
+        if watchers is not None:
+            watchers.discard(sid)
+            if not watchers:
+                del self._watchers[match_id]
+                self._views.pop(match_id, None)
+                self._dirty.pop(match_id, None)
+        watching = self._watching.get(sid)
+        if watching is not None:
+            watching.discard(match_id)
+            if not watching:
+                del self._watching[sid]
+
+    def _view(self, match_id, game):
+        view = self._views.get(match_id)
+        if view is None:
+            board = PackedBoard(game.board.shape[0])
+            board.assign(game.board)
+            view = self._views[match_id] = {
+                'board': board, 'moves': len(game.move_history), 'seq': 0,
+                'estimate': None, 'estimate_seq': None, 'estimate_frame': 0}
+        return view
+
+    def snapshot(self, match_id, game):
+        """Full state for a spectator joining or resyncing, aligned with frame seq"""
+        with self._lock:
+            seq = self._view(match_id, game)['seq']
+        return {
+            'match_id': match_id,
+            'seq': seq,
+            'board': game.board.tolist(),
+            'current_player': game.current_player,
+            **history_page(game),
+            'game_over': game.game_over,
+            'result_message': game.result_message,
+            'clock': clock_payload(match_id)
+        }
+
+    def _frame(self, match_id, game, view):
+        changes = view['board'].diff(game.board)
+        view['board'].assign(game.board)
+        moves = game.move_history[view['moves']:]
+        frame = {
+            'match_id': match_id,
+            'seq': view['seq'] + 1,
+            # Absolute [x, y, colour] values, so reapplying a frame is harmless
+            'changes': [[x, y, colour] for y, x, colour in changes],
+            'first_move': view['moves'],
+            'moves': moves,
+            'current_player': game.current_player,
+            'game_over': game.game_over,
+            'result_message': game.result_message,
+            'clock': clock_payload(match_id)
+        }
+        if self.score_estimate:
+            # Recomputed once the board has moved on and estimate_every frames
+            # have passed (or the game is over); other frames repeat the last one
+            board_seq = getattr(game, 'board_seq', len(game.move_history))
+            if view['estimate'] is None or (
+                    board_seq != view['estimate_seq']
+                    and (game.game_over
+                         or frame['seq'] - view['estimate_frame'] >= self.estimate_every)):
+                result = estimate(view['board'])
+                view['estimate'] = {
+                    'black': result.black,
+                    'white': result.white,
+                    'ownership': result.ownership.tolist(),
+                }
+                view['estimate_seq'], view['estimate_frame'] = board_seq, frame['seq']
+            frame['estimate'] = view['estimate']
+        view['seq'] += 1
+        view['moves'] += len(moves)
+        return frame
+
+    def flush_frames(self):
+        # Only this loop advances views, so frames are built outside the lock
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            work = [(match_id, game, self._view(match_id, game))
+                    for match_id, game in dirty.items()]
+        frames = [self._frame(match_id, game, view) for match_id, game, view in work]
+        with self._lock:
+            for match_id, game, _ in work:
+                if game.game_over:
+                    self._views.pop(match_id, None)
+            self.counters['frames'] += len(frames)
+        for frame in frames:
+            self.socketio.emit('spectator_frame', json.dumps(frame),
+                               room=spectator_room(frame['match_id']))
+
+    def flush_ticker(self):
+        with self._lock:
+            pending, self._ticker = self._ticker, {}
+            self.counters['ticker_frames'] += len(pending)
+        for tournament_id, games in pending.items():
+            self.socketio.emit('ticker_frame', json.dumps({
+                'tournament_id': tournament_id,
+                'games': list(games.values()),
+            }), room=ticker_room(tournament_id))
+
+    def run(self):
+        interval = 1.0 / self.max_fps
+        ticks_per_ticker = max(1, round(self.ticker_interval / interval))
+        tick = 0
+        while True:
+            self.socketio.sleep(interval)
+            try:
+                self.flush_frames()
+                tick += 1
+                if tick % ticks_per_ticker == 0:
+                    self.flush_ticker()
+            except Exception as e:
+                log_error("spectator_flush_failed", e)
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self.max_fps = app.config.setdefault('SPECTATOR_MAX_FPS', 4)
+        self.ticker_interval = app.config.setdefault('TICKER_INTERVAL', 1.0)
+        self.score_estimate = app.config.setdefault('SPECTATOR_SCORE_ESTIMATE', True)
+        self.estimate_every = app.config.setdefault('SPECTATOR_ESTIMATE_EVERY', 4)
+        # Local watchers are only the whole audience when nothing is shared
+        self.watched_only = (app.config.setdefault('GAME_STATE_BACKEND', 'memory') == 'memory'
+                             and not app.config.get('SOCKETIO_MESSAGE_QUEUE'))
+        socketio.start_background_task(self.run)
+
+
+spectator_channel = SpectatorChannel()
+
+
+def init_app(app, socketio):
+    spectator_channel.init_app(app, socketio)
@@ -1,18 +1,24 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
-import mysql.connector
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app
 import math
 from datetime import datetime
 from functools import wraps
+from .db_pool import bulk_insert, get_db
+from .metrics import log_error
+from .tournament_cache import invalidate, participants_page, tournament_list, tournament_summary
 
 bp_tournament = Blueprint('tournament', __name__, url_prefix='/tournament')
 
-def get_db():
-    return mysql.connector.connect(
-        host='localhost',
-        user='root',
-        password='',
-        database='register'
-    )
+REGISTRATION_QUERY = """
+    SELECT * FROM tournament_participants
+    WHERE tournament_id = %s AND user_id = %s
+"""
+SEEDING_QUERY = """
+    SELECT tp.id, tp.user_id, u.username, u.elo
+    FROM tournament_participants tp
+    JOIN users u ON tp.user_id = u.id
+    WHERE tp.tournament_id = %s
+    ORDER BY u.elo DESC
+"""
 
 def admin_required(f):
     @wraps(f)
@@ -25,19 +31,7 @@ def admin_required(f):
 
 @bp_tournament.route('/')
 def list_tournaments():
-    db = get_db()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT t.*, COUNT(tp.id) AS participant_count 
-        FROM tournaments t
-        LEFT JOIN tournament_participants tp ON t.id = tp.tournament_id
-        GROUP BY t.id
-        ORDER BY t.created_at DESC
-    """)
-    tournaments = cursor.fetchall()
-    cursor.close()
-    db.close()
-    return render_template('tournament/list.html', tournaments=tournaments)
+    return render_template('tournament/list.html', tournaments=tournament_list())
 
 @bp_tournament.route('/create', methods=['GET', 'POST'])
 @admin_required
@@ -58,42 +52,44 @@ def create_tournament():
         tournament_id = cursor.lastrowid
         cursor.close()
         db.close()
+        invalidate()
         flash('Tournament created successfully!')
         return redirect(url_for('tournament.view_tournament', tournament_id=tournament_id))
     return render_template('tournament/create.html')
 
 @bp_tournament.route('/<int:tournament_id>')
 def view_tournament(tournament_id):
-    db = get_db()
-    cursor = db.cursor(dictionary=True)
-    
-    cursor.execute("SELECT * FROM tournaments WHERE id = %s", (tournament_id,))
-    tournament = cursor.fetchone()
-    
-    cursor.execute("""
-        SELECT tp.*, u.username, u.elo
-        FROM tournament_participants tp
-        JOIN users u ON tp.user_id = u.id
-        WHERE tp.tournament_id = %s
-    """, (tournament_id,))
-    participants = cursor.fetchall()
-    
-    cursor.execute("""
-        SELECT COUNT(*) as registered FROM tournament_participants
-        WHERE tournament_id = %s
-    """, (tournament_id,))
-    registered = cursor.fetchone()['registered']
-    
-    cursor.close()
-    db.close()
-    
+    tournament = tournament_summary(tournament_id)
+    if tournament is None:
+        flash('Tournament not found')
+        return redirect(url_for('tournament.list_tournaments'))
+
+    after = request.args.get('after', 0, type=int)
+    participants, next_after = participants_page(
+        tournament_id, after, current_app.config.get('PARTICIPANT_PAGE_SIZE', 100))
+
+    registered = tournament['current_participants']
     progress = min((registered / 2048) * 100, 100)
     return render_template('tournament/view.html', 
                          tournament=tournament,
                          participants=participants,
+                         next_after=next_after,
                          registered=registered,
                          progress=progress)
 
+@bp_tournament.route('/<int:tournament_id>/participants')
+def list_participants(tournament_id):
+    """JSON page of participants; pass next_after back as ?after= for the next page"""
+    page_size = current_app.config.get('PARTICIPANT_PAGE_SIZE', 100)
+    after = request.args.get('after', 0, type=int)
+    limit = max(1, min(request.args.get('limit', page_size, type=int), page_size))
+    participants, next_after = participants_page(tournament_id, after, limit)
+    return jsonify({
+        'tournament_id': tournament_id,
+        'participants': participants,
+        'next_after': next_after,
+    })
+
 @bp_tournament.route('/<int:tournament_id>/register', methods=['POST'])
 def register_for_tournament(tournament_id):
     if 'user_id' not in session:
@@ -107,10 +103,7 @@ def register_for_tournament(tournament_id):
         cursor.execute("SELECT * FROM tournaments WHERE id = %s", (tournament_id,))
         tournament = cursor.fetchone()
         
-        cursor.execute("""
-            SELECT * FROM tournament_participants
-            WHERE tournament_id = %s AND user_id = %s
-        """, (tournament_id, session['user_id']))
+        cursor.execute(REGISTRATION_QUERY, (tournament_id, session['user_id']))
         if cursor.fetchone():
             flash('Already registered!')
             return redirect(url_for('tournament.view_tournament', tournament_id=tournament_id))
@@ -127,6 +120,7 @@ def register_for_tournament(tournament_id):
         """, (tournament_id,))
         
         db.commit()
+        invalidate(tournament_id)
         flash('Registration successful!')
         
         if tournament['current_participants'] + 1 >= 2048:
@@ -140,8 +134,52 @@ def register_for_tournament(tournament_id):
     
     return redirect(url_for('tournament.view_tournament', tournament_id=tournament_id))
 
+@bp_tournament.route('/<int:tournament_id>/start', methods=['POST'])
+@admin_required
+def start_tournament_route(tournament_id):
+    # Import here to avoid circular imports
+    from .tournament_executor import run_tournament
+
+    db = get_db()
+    cursor = db.cursor(dictionary=True)
+    try:
+        started = start_tournament(db, cursor, tournament_id)
+    finally:
+        cursor.close()
+        db.close()
+
+    if started:
+        run_tournament(current_app._get_current_object(), tournament_id)
+        flash('Tournament started! First round matches are being played.')
+    else:
+        flash('Tournament could not be started. It needs exactly 2048 registered players.')
+    return redirect(url_for('tournament.view_tournament', tournament_id=tournament_id))
+
+@bp_tournament.route('/<int:tournament_id>/progress')
+def tournament_progress(tournament_id):
+    # Import here to avoid circular imports
+    from .tournament_executor import executors
+
+    executor = executors.get(tournament_id)
+    if executor is None:
+        return jsonify({'tournament_id': tournament_id, 'running': False})
+    return jsonify(dict(executor.progress(), running=True))
+
+BRACKET_SIZE = 2048
+TOTAL_ROUNDS = 11  # log2(2048) = 11 rounds
+
+def bracket_offset(round_no):
+    """Index of the first slot of a round when slots are laid out round by round"""
+    return BRACKET_SIZE - (BRACKET_SIZE >> (round_no - 1))
+
 def start_tournament(db, cursor, tournament_id):
-    """Initialize the tournament bracket with 2048 participants"""
+    """Initialize the tournament bracket with 2048 participants.
+
+    The whole bracket is written in one transaction with a handful of
+    set-based statements: one seed UPDATE, one multi-row INSERT for every
+    match, whose AUTO_INCREMENT ids are read back in one range query, and
+    multi-row INSERTs for tournament_matches.
+    """
     try:
         # Get tournament details
         cursor.execute("""
@@ -154,75 +192,54 @@ def start_tournament(db, cursor, tournament_id):
             return False
 
         # Get participants ordered by ELO for proper seeding
-        cursor.execute("""
-            SELECT tp.id, tp.user_id, u.username, u.elo
-            FROM tournament_participants tp
-            JOIN users u ON tp.user_id = u.id
-            WHERE tp.tournament_id = %s
-            ORDER BY u.elo DESC
-        """, (tournament_id,))
+        cursor.execute(SEEDING_QUERY, (tournament_id,))
         participants = cursor.fetchall()
 
         num_participants = len(participants)
-        if num_participants != 2048:
+        if num_participants != BRACKET_SIZE:
             return False
 
-        # Assign seeds based on ELO ranking
+        # Assign seeds based on ELO ranking in a single statement
+        seed_params = []
         for seed, participant in enumerate(participants, 1):
-            cursor.execute("""
-                UPDATE tournament_participants
-                SET seed = %s
-                WHERE id = %s
-            """, (seed, participant['id']))
+            seed_params.extend((participant['id'], seed))
             participant['seed'] = seed
+        cursor.execute(
+            "UPDATE tournament_participants SET seed = CASE id "
+            + " ".join(["WHEN %s THEN %s"] * num_participants)
+            + " END WHERE tournament_id = %s",
+            seed_params + [tournament_id]
+        )
 
-        db.commit()
+        # First round matches (1v2, 3v4, ...) come first, empty slots for
+        # rounds 2-11 follow round by round. One statement lets InnoDB hand
+        # out the ids, so concurrent inserts into matches never collide.
+        slots = [
+            (participants[i]['user_id'], participants[i + 1]['user_id'], 'active')
+            for i in range(0, BRACKET_SIZE, 2)
+        ] + [(None, None, 'waiting')] * (BRACKET_SIZE // 2 - 1)
+        bulk_insert(cursor,
+                    "INSERT INTO matches (player1_id, player2_id, status)",
+                    "(%s, %s, %s)", slots, chunk_size=len(slots))
 
-        # Tournament structure calculations
-        total_rounds = 11  # log2(2048) = 11 rounds
-        matches_per_round = 1024  # Starting with 1024 matches in first round
-
-        # Create first round matches (1v2048, 2v2047, etc.)
-        for i in range(0, 2048, 2):
-            # Calculate positions using standard tournament seeding
-            p1 = participants[i]
-            p2 = participants[i + 1]
-
-            # Create match record
-            cursor.execute("""
-                INSERT INTO matches 
-                (player1_id, player2_id, status)
-                VALUES (%s, %s, 'active')
-            """, (p1['user_id'], p2['user_id']))
-            match_id = cursor.lastrowid
-
-            # Track tournament match
-            cursor.execute("""
-                INSERT INTO tournament_matches
-                (tournament_id, match_id, round, position)
-                VALUES (%s, %s, %s, %s)
-            """, (tournament_id, match_id, 1, i//2))
-
-        # Create empty matches for subsequent rounds
-        current_round = 2
-        while current_round <= total_rounds:
-            matches_in_round = 2048 // (2 ** current_round)
-            for pos in range(matches_in_round):
-                # Create empty match slot
-                cursor.execute("""
-                    INSERT INTO matches (status)
-                    VALUES ('waiting')
-                """)
-                match_id = cursor.lastrowid
-                
-                # Link to tournament structure
-                cursor.execute("""
-                    INSERT INTO tournament_matches
-                    (tournament_id, match_id, round, position)
-                    VALUES (%s, %s, %s, %s)
-                """, (tournament_id, match_id, current_round, pos))
-            
-            current_round += 1
+        # Ids within one statement only ever increase, but with interleaved
+        # auto-increment locking they need not be consecutive. Rows other
+        # transactions insert meanwhile are outside this transaction's
+        # snapshot, so the range read sees exactly the rows just inserted.
+        cursor.execute("SELECT LAST_INSERT_ID() AS first_id")
+        first_match_id = cursor.fetchone()['first_id']
+        cursor.execute("SELECT id FROM matches WHERE id >= %s ORDER BY id LIMIT %s",
+                       (first_match_id, len(slots)))
+        match_ids = [row['id'] for row in cursor.fetchall()]
+
+        bracket = [
+            (tournament_id, match_ids[bracket_offset(round_no) + pos], round_no, pos)
+            for round_no in range(1, TOTAL_ROUNDS + 1)
+            for pos in range(BRACKET_SIZE >> round_no)
+        ]
+        bulk_insert(cursor,
+                    "INSERT INTO tournament_matches (tournament_id, match_id, round, position)",
+                    "(%s, %s, %s, %s)", bracket)
 
         # Update tournament status
         cursor.execute("""
@@ -232,13 +249,13 @@ def start_tournament(db, cursor, tournament_id):
         """, (tournament_id,))
         
         db.commit()
+        invalidate(tournament_id)
         return True
 
     except Exception as e:
-        print(f"Error starting tournament: {str(e)}")
+        log_error("tournament_start_failed", e, tournament_id=tournament_id)
         db.rollback()
         return False
     finally:
         # Don't close connection here - handled by caller
         pass
-
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from .db_pool import get_db
+
+LIST_KEY = 'list'
+
+TOURNAMENT_LIST_QUERY = """
+    SELECT t.*, t.current_participants AS participant_count
+    FROM tournaments t
+    ORDER BY t.created_at DESC
+"""
+TOURNAMENT_QUERY = "SELECT * FROM tournaments WHERE id = %s"
+PARTICIPANTS_PAGE_QUERY = """
+    SELECT tp.id, tp.user_id, tp.seed, tp.status, u.username, u.elo
+    FROM tournament_participants tp
+    JOIN users u ON tp.user_id = u.id
+    WHERE tp.tournament_id = %s AND tp.id > %s
+    ORDER BY tp.id
+    LIMIT %s
+"""
+
+
+class TournamentCache:
+    """Read-through cache for tournament summaries and the tournament list.
+
+    Entries are dropped explicitly when registration or status changes, and
+    expire after ttl seconds so other server processes catch up as well.
+    """
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self._entries = {}
+        self._generation = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, key, load):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.stats['hits'] += 1
+                return entry[1]
+            self.stats['misses'] += 1
+            generation = self._generation.get(key, 0)
+
+        value = load()
+        with self._lock:
+            # Don't store a value loaded before an invalidation landed
+            if self._generation.get(key, 0) == generation:
+                self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._generation[key] = self._generation.get(key, 0) + 1
+                self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            for key in self._entries:
+                self._generation[key] = self._generation.get(key, 0) + 1
+            self._entries.clear()
+
+
+tournament_cache = TournamentCache()
+
+
+def _query(sql, params=()):
+    db = get_db()
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        db.close()
+
+
+def tournament_list():
+    """Every tournament with its participant count, newest first"""
+    return tournament_cache.get(LIST_KEY, lambda: _query(TOURNAMENT_LIST_QUERY))
+
+
+def tournament_summary(tournament_id):
+    """The tournaments row for one tournament, or None"""
+    def load():
+        rows = _query(TOURNAMENT_QUERY, (tournament_id,))
+        return rows[0] if rows else None
+    return tournament_cache.get(tournament_id, load)
+
+
+def participants_page(tournament_id, after=0, limit=100):
+    """One page of participants in registration order, keyed on the last id seen.
+
+    Returns (participants, next_after); next_after is None on the last page.
+    """
+    rows = _query(PARTICIPANTS_PAGE_QUERY, (tournament_id, after, limit + 1))
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1]['id']
+    return rows, None
+
+
+def invalidate(tournament_id=None):
+    """Drop a tournament's summary (if given) and the tournament list"""
+    if tournament_id is None:
+        tournament_cache.invalidate(LIST_KEY)
+    else:
+        tournament_cache.invalidate(tournament_id, LIST_KEY)
+
+
+def init_app(app):
+    """Configure the summary cache (TOURNAMENT_CACHE_TTL, PARTICIPANT_PAGE_SIZE)"""
+    app.config.setdefault('TOURNAMENT_CACHE_TTL', 5.0)
+    app.config.setdefault('PARTICIPANT_PAGE_SIZE', 100)
+    tournament_cache.ttl = app.config['TOURNAMENT_CACHE_TTL']
+    tournament_cache.clear()
@@ -0,0 +1,318 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from .agent_pool import AgentError, AgentPool, agent_path
+from .db_pool import bulk_insert, get_db
+from .go_rules import GoEngine, IllegalMove
+from .observation import ObservationBuffer
+from .metrics import log_error
+from .packed_board import BLACK, WHITE
+from .ratings import rating_engine
+from .scoring import KOMI, score
+from .spectator import spectator_channel
+from .tournament import TOTAL_ROUNDS
+from .tournament_cache import invalidate
+
+BRACKET_QUERY = """
+    SELECT tm.round, tm.position, tm.match_id, m.player1_id, m.player2_id, m.status
+    FROM tournament_matches tm
+    JOIN matches m ON m.id = tm.match_id
+    WHERE tm.tournament_id = %s
+"""
+
+# tournament_id -> TournamentExecutor currently playing it
+executors = {}
+
+# Per-process agent pool, created by _init_worker in each pool process
+_agent_pool = None
+
+
+def _init_worker(pool_settings):
+    global _agent_pool
+    _agent_pool = AgentPool(**pool_settings)
+
+
+def play_match(black_path, white_path, max_moves=722):
+    """Play one agent-vs-agent game inside a pool process.
+
+    Returns (winning colour, moves played as (x, y) or None for a pass),
+    the moves in order from black's first. An agent that errors, times
+    out or plays an illegal move (occupied, off the board, suicide or
+    superko) forfeits.
+    """
+    engine = GoEngine()
+    observation = ObservationBuffer(engine.size)
+    paths = {BLACK: black_path, WHITE: white_path}
+    player, passes, moves = BLACK, 0, []
+    try:
+        observation.reset(engine, player)
+        while passes < 2 and len(moves) < max_moves:
+            try:
+                move = _agent_pool.request_move(paths[player], observation, player)
+            except AgentError:
+                return 3 - player, moves
+            captured = []
+            if move is None:
+                passes += 1
+            else:
+                try:
+                    captured = engine.play(*move, player)
+                except (IllegalMove, TypeError):
+                    return 3 - player, moves
+                passes = 0
+            moves.append(move and (move[0], move[1]))
+            observation.update(engine, move, player, captured, 3 - player)
+            player = 3 - player
+    finally:
+        observation.close()
+    # Tromp-Taylor: area scoring with every stone on the board counted alive
+    return score(engine.board, KOMI).winner, moves
+
+
+class BracketSlot:
+    __slots__ = ('round', 'position', 'match_id', 'player1_id', 'player2_id', 'status')
+
+    def __init__(self, row):
+        for name in self.__slots__:
+            setattr(self, name, row[name])
+
+    @property
+    def ready(self):
+        return self.status != 'completed' and self.player1_id and self.player2_id
+
+
+class TournamentExecutor:
+    """Plays a started tournament bracket across a process pool.
+
+    Every playable match is submitted as soon as both of its players are
+    known, so round r+1 position p starts the moment its two feeders
+    (round r positions 2p and 2p+1) have finished rather than after the
+    whole of round r.
+    """
+
+    def __init__(self, app, tournament_id, workers=None, play=play_match):
+        self.app = app
+        self.tournament_id = tournament_id
+        self.workers = workers or app.config.get('TOURNAMENT_WORKERS') or os.cpu_count()
+        self.play = play
+        self.slots = {}
+        self.agents = {}
+        self.completed = 0
+        self.in_flight = 0
+        self.champion_id = None
+        self.error = None
+        self.attempts = {}
+        self.pool_settings = None
+        self.max_retries = 2
+        self._pool = None
+
+    def _load(self, cursor):
+        cursor.execute(BRACKET_QUERY, (self.tournament_id,))
+        for row in cursor.fetchall():
+            slot = BracketSlot(row)
+            self.slots[(slot.round, slot.position)] = slot
+            if slot.status == 'completed':
+                self.completed += 1
+
+        cursor.execute("""
+            SELECT u.id, u.username, u.agentFile, u.agent_hash
+            FROM tournament_participants tp
+            JOIN users u ON tp.user_id = u.id
+            WHERE tp.tournament_id = %s
+        """, (self.tournament_id,))
+        for row in cursor.fetchall():
+            self.agents[row['id']] = agent_path(row['username'], row['agentFile'], row['agent_hash'])
+
+    def _record(self, cursor, slot, winner_id, loser_id, colour, moves):
+        """Persist one result and its moves and move the winner into the next
+        round's slot"""
+        cursor.execute("""
+            UPDATE matches SET status = 'completed', winner = %s, ended_at = NOW()
+            WHERE id = %s
+        """, (colour, slot.match_id))
+        bulk_insert(cursor,
+                    "INSERT IGNORE INTO moves (match_id, move_number, x, y, color)",
+                    "(%s, %s, %s, %s, %s)",
+                    [(slot.match_id, n, *(move or (None, None)), BLACK if n % 2 else WHITE)
+                     for n, move in enumerate(moves, 1)])
+        cursor.execute("""
+            UPDATE tournament_participants SET status = 'eliminated'
+            WHERE tournament_id = %s AND user_id = %s
+        """, (self.tournament_id, loser_id))
+        slot.status = 'completed'
+
+        if slot.round == TOTAL_ROUNDS:
+            cursor.execute("""
+                UPDATE tournaments SET status = 'completed', end_date = NOW()
+                WHERE id = %s
+            """, (self.tournament_id,))
+            self.champion_id = winner_id
+            return None
+
+        nxt = self.slots[(slot.round + 1, slot.position // 2)]
+        if slot.position % 2 == 0:
+            nxt.player1_id = winner_id
+        else:
+            nxt.player2_id = winner_id
+        nxt.status = 'active' if nxt.player1_id and nxt.player2_id else 'waiting'
+        cursor.execute("""
+            UPDATE matches SET player1_id = %s, player2_id = %s, status = %s
+            WHERE id = %s
+        """, (nxt.player1_id, nxt.player2_id, nxt.status, nxt.match_id))
+        return nxt if nxt.ready else None
+
+    def _submit(self, pending, slot):
+        args = (self.play, self.agents[slot.player1_id], self.agents[slot.player2_id])
+        try:
+            future = self._pool.submit(*args)
+        except BrokenProcessPool:
+            # A crashed worker takes the whole pool down with it
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._new_pool()
+            future = self._pool.submit(*args)
+        pending[future] = slot
+        spectator_channel.ticker(self.tournament_id, slot.match_id, round=slot.round,
+                                 player1_id=slot.player1_id, player2_id=slot.player2_id,
+                                 status='active')
+
+    def _new_pool(self):
+        """Worker processes started by forkserver (spawn where unavailable):
+        forking this threaded, possibly monkey-patched server is unsafe"""
+        method = self.app.config.get('TOURNAMENT_START_METHOD') or (
+            'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(self.pool_settings,),
+                                   mp_context=multiprocessing.get_context(method))
+
+    def _transaction(self, work):
+        """Run work(cursor) on a connection borrowed just for this batch"""
+        with self.app.app_context():
+            db = get_db()
+            cursor = db.cursor(dictionary=True)
+            try:
+                result = work(cursor)
+                db.commit()
+                return result
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                cursor.close()
+                db.close()
+
+    def _retry(self, pending, slot):
+        """Resubmit a match whose worker failed; False once it is out of retries"""
+        attempts = self.attempts[slot.match_id] = self.attempts.get(slot.match_id, 0) + 1
+        if attempts > self.max_retries:
+            return False
+        self._submit(pending, slot)
+        return True
+
+    def _fail(self, cursor, slot):
+        """Stop the tournament on a match that cannot be played"""
+        cursor.execute("UPDATE matches SET status = 'error' WHERE id = %s", (slot.match_id,))
+        cursor.execute("UPDATE tournaments SET status = 'error' WHERE id = %s",
+                       (self.tournament_id,))
+        slot.status = 'error'
+
+    def _results(self, done, pending):
+        """Finished games from done; failed ones are retried or, out of
+        retries, returned as failures"""
+        results, failed = [], []
+        for future in done:
+            slot = pending.pop(future)
+            try:
+                colour, moves = future.result()
+            except Exception as e:
+                # Infrastructure failures never become results or ratings
+                log_error("tournament_match_failed", e, tournament_id=self.tournament_id,
+                          match_id=slot.match_id)
+                if self.error is None and self._retry(pending, slot):
+                    continue
+                failed.append(slot)
+                continue
+            results.append((slot, colour, moves))
+        return results, failed
+
+    def _record_batch(self, cursor, results, failed):
+        playable = []
+        for slot in failed:
+            self._fail(cursor, slot)
+        for slot, colour, moves in results:
+            winner, loser = ((slot.player1_id, slot.player2_id) if colour == BLACK
+                             else (slot.player2_id, slot.player1_id))
+            nxt = self._record(cursor, slot, winner, loser, colour, moves)
+            if nxt is not None:
+                playable.append(nxt)
+        return playable
+
+    def run(self):
+        per_process = max(2, self.app.config.get('AGENT_POOL_MAX_PROCESSES', 32) // self.workers)
+        self.pool_settings = {
+            'max_processes': per_process,
+            'move_timeout': self.app.config.get('AGENT_MOVE_TIMEOUT', 5.0),
+            'memory_mb': self.app.config.get('AGENT_MEMORY_MB', 512),
+            'entrypoint': self.app.config.get('AGENT_ENTRYPOINT', 'get_move'),
+        }
+        self.max_retries = self.app.config.get('TOURNAMENT_MATCH_RETRIES', 2)
+        try:
+            self._transaction(self._load)
+            self._pool = self._new_pool()
+            pending = {}
+            for slot in self.slots.values():
+                if slot.ready:
+                    self._submit(pending, slot)
+            while pending:
+                self.in_flight = len(pending)
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                results, failed = self._results(done, pending)
+                if not results and not failed:
+                    continue
+                # One pooled connection per batch of finished games, not
+                # one held for the whole tournament
+                playable = self._transaction(
+                    lambda cursor: self._record_batch(cursor, results, failed))
+                if failed and self.error is None:
+                    self.error = f"match {failed[0].match_id} could not be played"
+                    invalidate(self.tournament_id)
+                for slot, colour, _ in results:
+                    rating_engine.submit(slot.match_id, colour)
+                    winner = slot.player1_id if colour == BLACK else slot.player2_id
+                    spectator_channel.ticker(self.tournament_id, slot.match_id,
+                                             status='completed', winner_id=winner)
+                    if slot.round == TOTAL_ROUNDS:
+                        invalidate(self.tournament_id)
+                    self.completed += 1
+                for slot in failed:
+                    spectator_channel.ticker(self.tournament_id, slot.match_id, status='error')
+                if self.error is None:
+                    for nxt in playable:
+                        self._submit(pending, nxt)
+            self.in_flight = 0
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            executors.pop(self.tournament_id, None)
+
+    def progress(self):
+        return {
+            'tournament_id': self.tournament_id,
+            'workers': self.workers,
+            'matches_total': len(self.slots),
+            'matches_completed': self.completed,
+            'matches_in_flight': self.in_flight,
+            'champion_id': self.champion_id,
+            'error': self.error,
+        }
+
+
+def run_tournament(app, tournament_id):
+    """Play a started tournament in the background; returns its executor"""
+    if tournament_id in executors:
+        return executors[tournament_id]
+    executor = executors[tournament_id] = TournamentExecutor(app, tournament_id)
+    threading.Thread(target=executor.run, name=f"tournament-{tournament_id}", daemon=True).start()
+    return executor